@@ -0,0 +1,125 @@
+# File: batch.py
+# Ricerca in batch: una crew per topic, più crew in parallelo con un limite globale
+# di chiamate LLM (LLM_MAX_IN_FLIGHT) e LLM/tools condivisi
+#
+# Uso:  python batch.py topics.txt --workers 4
+# topics.txt: un topic per riga (righe vuote e "#" ignorate)
+#
+# Ogni articolo viene scritto in output/ appena pronto e lo stato del batch in
+# output/batch_report.json: rilanciando lo stesso file si riparte dai topic mancanti.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import main
+
+REPORT = os.path.join(main.OUTPUT_DIR, "batch_report.json")
+
+
+def read_topics(path: str) -> list:
+    """Topic del file, senza duplicati e nell'ordine originale."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+class BatchReport:
+    """Stato dei topic (ok/failed) salvato su disco a ogni aggiornamento."""
+
+    def __init__(self, path: str = REPORT):
+        self.path = path
+        self.lock = threading.Lock()
+        self.topics = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.topics = json.load(f)
+
+    def update(self, topic: str, **entry):
+        with self.lock:
+            self.topics[topic] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.topics, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+
+def run_topic(topic: str, retries: int) -> dict:
+    """Esegue la crew sul topic (con retry); ritorna l'esito senza sollevare eccezioni."""
+    t0 = time.perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            _, filename, summary = main.research(topic, verbose=False)
+            totals = summary["totals"]
+            return {"status": "ok", "file": filename, "attempts": attempt + 1,
+                    "seconds": round(time.perf_counter() - t0, 1), "llm_calls": totals["llm_calls"],
+                    "tokens": totals["prompt_tokens"] + totals["completion_tokens"]}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt < retries:
+                print(f"⚠️ {topic}: {error} (retry {attempt + 1}/{retries})")
+                time.sleep(5 * (attempt + 1))
+            else:
+                traceback.print_exc()
+    return {"status": "failed", "error": error, "attempts": retries + 1,
+            "seconds": round(time.perf_counter() - t0, 1)}
+
+
+def run_batch(topics: list, workers: int, retries: int = 1, force: bool = False) -> dict:
+    report = BatchReport()
+    # Gli articoli già scritti sopravvivono a crash e interruzioni: non si rifanno
+    todo = [topic for topic in topics if force or not os.path.exists(main.article_path(topic))]
+    print(f"📚 {len(topics)} topics, {len(topics) - len(todo)} already done, "
+          f"{workers} crews in parallel, max {main.LLM_MAX_IN_FLIGHT} LLM calls in flight")
+
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(run_topic, topic, retries): topic for topic in todo}
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            topic = futures[future]
+            result = future.result()
+            results[topic] = result
+            report.update(topic, **result)
+            icon = "✅" if result["status"] == "ok" else "❌"
+            detail = result.get("file") or result.get("error")
+            print(f"{icon} [{done}/{len(todo)}] {topic} ({result['seconds']}s): {detail}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted: finished articles are saved, rerun to continue")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Ricerca in batch di più topic")
+    parser.add_argument("topics_file", help="file con un topic per riga")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")),
+                        help="crew eseguite in parallelo")
+    parser.add_argument("--retries", type=int, default=1, help="nuovi tentativi per topic fallito")
+    parser.add_argument("--force", action="store_true", help="rigenera anche gli articoli già presenti")
+    args = parser.parse_args()
+
+    topics = read_topics(args.topics_file)
+    if not topics:
+        print("❌ No topics found")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    results = run_batch(topics, args.workers, args.retries, args.force)
+    failed = [topic for topic, result in results.items() if result["status"] != "ok"]
+    print(f"\n{'='*60}")
+    print(f"✅ {len(results) - len(failed)} articles written, ❌ {len(failed)} failed "
+          f"in {time.perf_counter() - t0:.0f}s (report: {REPORT})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+# File: cache.py
+# Cache su disco (SQLite) per ricerche e pagine scaricate, con TTL per namespace:
+# rieseguire o rifinire lo stesso topic riusa la fase di ricerca
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# TTL per tipo di dato (secondi): i risultati di ricerca invecchiano prima delle pagine
+TTLS = {
+    "search": int(os.getenv("RESEARCH_SEARCH_TTL", str(24 * 3600))),
+    "page": int(os.getenv("RESEARCH_PAGE_TTL", str(7 * 24 * 3600))),
+}
+DEFAULT_TTL = 24 * 3600
+
+CACHE_DB = os.getenv("RESEARCH_CACHE_DB", ".cache/research.sqlite")
+ENABLED = os.getenv("RESEARCH_CACHE", "1") == "1"
+
+
+def make_key(*parts) -> str:
+    """Chiave stabile (hash) da query, URL e parametri."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Tabella SQLite (namespace, key) -> valore JSON con scadenza; condivisa tra thread."""
+
+    def __init__(self, db_path: str = CACHE_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, expires_at REAL, value TEXT, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, namespace: str, key: str):
+        """Ritorna il valore in cache o None se assente/scaduto."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time())
+            ).fetchone()
+            counter = self.hits if row else self.misses
+            counter[namespace] = counter.get(namespace, 0) + 1
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else TTLS.get(namespace, DEFAULT_TTL))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (namespace, key, expires_at, json.dumps(value, ensure_ascii=False))
+            )
+            self.db.commit()
+
+    def purge(self):
+        """Elimina le voci scadute."""
+        with self.lock:
+            self.db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self.db.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM cache")
+            self.db.commit()
+
+
+# Cache condivisa da tools e pipeline (None se disattivata con RESEARCH_CACHE=0)
+cache = DiskCache() if ENABLED else None
+if cache:
+    cache.purge()
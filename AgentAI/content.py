@@ -0,0 +1,190 @@
+# File: content.py
+# Elaborazione delle pagine prima degli agent: rimozione del boilerplate, passaggi
+# duplicati tra fonti diverse e selezione dei passaggi più rilevanti entro un budget di token
+
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+# Token (stimati) di fonti passati al researcher, per tutte le fonti insieme
+TOKEN_BUDGET = int(os.getenv("RESEARCH_TOKEN_BUDGET", "6000"))
+# Quota massima del budget per una singola fonte: il dossier resta vario
+MAX_SOURCE_SHARE = float(os.getenv("RESEARCH_MAX_SOURCE_SHARE", "0.35"))
+PASSAGE_WORDS = 120          # Dimensione massima indicativa di un passaggio
+MIN_PASSAGE_WORDS = 15       # Sotto questa soglia un paragrafo si unisce al successivo
+# Quota di shingle del passaggio più corto presente nell'altro oltre cui sono "lo stesso"
+# (copre anche le citazioni parziali e le piccole modifiche tra siti diversi)
+DUPLICATE_OVERLAP = 0.8
+
+# Elementi che non contengono mai il testo dell'articolo
+BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form",
+                    "iframe", "svg", "button", "select"]
+BOILERPLATE_RE = re.compile(
+    r"cookie|subscribe|sign (in|up)|log ?in|newsletter|all rights reserved|privacy policy|"
+    r"terms of (use|service)|share (on|this)|follow us|advertisement|read more|related (posts|articles)",
+    re.IGNORECASE
+)
+WORD_RE = re.compile(r"\w+")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Parole troppo comuni per dire qualcosa sulla rilevanza (inglese e italiano)
+STOPWORDS = set("""
+the and for are but not you all any can had her was one our out has have from this that with
+they will would there their what about which when make like time just know take into your some
+could them than then now only its also after use how our more most other over such very
+del della delle dei degli che per con una uno non sono come anche più alla alle agli nel nella
+""".split())
+
+# Termini che descrivono cosa cerca il research task, oltre al topic
+FOCUS_TERMS = "news announcement release technology framework tool trend adoption use case application"
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima veloce (circa 4 caratteri per token), senza scaricare un tokenizer."""
+    return len(text) // 4 + 1
+
+
+def extract_text(html: str) -> str:
+    """Testo principale di una pagina HTML, una riga per blocco, senza menu e piè di pagina."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    return clean_text(root.get_text("\n"))
+
+
+def clean_text(text: str) -> str:
+    """Toglie righe di navigazione, banner e righe ripetute da un testo già estratto."""
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        words = len(line.split())
+        if not line or line in seen:
+            continue
+        # Voci di menu e bottoni: poche parole e nessuna frase
+        if words < 5 and not line.endswith((".", "!", "?", ":")):
+            continue
+        if words < 30 and BOILERPLATE_RE.search(line):
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> list:
+    """Un passaggio per paragrafo: i lunghi divisi per frasi, quelli brevi (titoli) uniti al successivo."""
+    passages = []
+    pending = ""
+    for paragraph in text.splitlines():
+        current = []
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            if current and len(" ".join(current + [sentence]).split()) > max_words:
+                passages.append(" ".join(current))
+                current = []
+            current.append(sentence)
+        passage = " ".join(current)
+        if pending:
+            passage = f"{pending} {passage}"
+        pending = ""
+        if len(passage.split()) < MIN_PASSAGE_WORDS:
+            pending = passage
+        else:
+            passages.append(passage)
+    if pending:
+        passages.append(pending)
+    return passages
+
+
+def tokenize(text: str) -> list:
+    return [word for word in WORD_RE.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+def _shingles(words: list, size: int = 3) -> set:
+    if len(words) < size:
+        return {" ".join(words)}
+    return {hashlib.md5(" ".join(words[i:i + size]).encode()).digest()[:8]
+            for i in range(len(words) - size + 1)}
+
+
+def bm25_scores(documents: list, query: list, k1: float = 1.5, b: float = 0.75) -> list:
+    """Punteggio BM25 di ogni documento (lista di parole) rispetto alle parole della query."""
+    if not documents:
+        return []
+    avg_len = sum(len(doc) for doc in documents) / len(documents) or 1
+    document_frequency = Counter(word for doc in documents for word in set(doc))
+    idf = {word: math.log(1 + (len(documents) - document_frequency[word] + 0.5) / (document_frequency[word] + 0.5))
+           for word in set(query)}
+    scores = []
+    for doc in documents:
+        counts = Counter(doc)
+        score = 0.0
+        for word in query:
+            tf = counts.get(word, 0)
+            if tf:
+                score += idf[word] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+def select_passages(pages: list, topic: str, budget: int = TOKEN_BUDGET) -> list:
+    """Passaggi più rilevanti per il topic, senza duplicati, entro il budget di token.
+
+    pages: testi puliti, uno per fonte. Ritorna tuple (fonte, posizione, testo) nell'ordine
+    delle fonti, così ogni fonte si legge nell'ordine originale.
+    """
+    passages = [(source, position, text)
+                for source, page in enumerate(pages)
+                for position, text in enumerate(split_passages(page))]
+    words = [tokenize(text) for _, _, text in passages]
+    # Il topic pesa il doppio dei termini generici del task
+    query = tokenize(topic) * 2 + tokenize(FOCUS_TERMS)
+    scores = bm25_scores(words, query)
+
+    selected = []
+    kept_shingles = []
+    used = Counter()
+    total = 0
+    source_budget = max(1, int(budget * MAX_SOURCE_SHARE))
+    for i in sorted(range(len(passages)), key=lambda i: -scores[i]):
+        if scores[i] <= 0:
+            break
+        source, _, text = passages[i]
+        tokens = estimate_tokens(text)
+        if total + tokens > budget or used[source] + tokens > source_budget:
+            continue
+        # Lo stesso comunicato ripreso da più siti (o ripetuto nella pagina) entra una volta sola
+        shingles = _shingles(words[i])
+        if any(len(shingles & kept) / min(len(shingles), len(kept)) >= DUPLICATE_OVERLAP for kept in kept_shingles):
+            continue
+        kept_shingles.append(shingles)
+        selected.append(passages[i])
+        used[source] += tokens
+        total += tokens
+    return sorted(selected)
+
+
+def build_dossier(sources: list, pages: list, topic: str, budget: int = TOKEN_BUDGET) -> str:
+    """Dossier compatto per il research task: per ogni fonte titolo, URL e passaggi scelti.
+
+    sources: risultati di ricerca (title, link, snippet, date); pages: testo pulito delle pagine.
+    Una fonte senza passaggi utili compare solo con lo snippet della ricerca.
+    """
+    # Lo snippet del motore di ricerca vale come testo se la pagina non è leggibile
+    texts = [page or source.get("snippet", "") for source, page in zip(sources, pages)]
+    by_source = {}
+    for source, _, text in select_passages(texts, topic, budget):
+        by_source.setdefault(source, []).append(text)
+
+    sections = []
+    for i, source in enumerate(sources):
+        header = f"[{i + 1}] {source.get('title', '')}\nURL: {source['link']}"
+        if source.get("date"):
+            header += f"\nDate: {source['date']}"
+        body = "\n".join(by_source.get(i, [])) or source.get("snippet", "")
+        sections.append(f"{header}\n{body}")
+    return "\n\n---\n\n".join(sections)
@@ -0,0 +1,279 @@
+# File: instrumentation.py
+# Tempi e token per agent, task e tool di un run della crew: report JSON e tabella riassuntiva
+#
+# Token per chiamata: CrewAI li espone pubblicamente solo come totale dell'LLM
+# (get_token_usage_summary), che qui è condiviso da tutte le crew in parallelo; il conteggio
+# per chiamata passa quindi da LLM._track_token_usage_internal, con crewai fissato in
+# requirements.txt alla minor su cui è stato verificato. Se il metodo sparisce si ripiega sulla
+# differenza del totale pubblico prima/dopo la chiamata (esatta solo senza chiamate sovrapposte).
+
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from crewai import Agent
+
+# Tracker del run in corso (uno per topic, anche con più crew in parallelo nel batch)
+current_tracker = ContextVar("current_tracker", default=None)
+# Chiamata LLM in corso nel thread: raccoglie attesa e token riportati da CrewAI
+_current_call = ContextVar("current_call", default=None)
+# (agent, task) in esecuzione in questo contesto: a chi vanno chiamate LLM e tools
+_current_owner = ContextVar("current_owner", default=None)
+
+PIPELINE = "pipeline"  # "Agent" delle fasi senza LLM (raccolta delle fonti)
+
+
+def _bucket() -> dict:
+    return {"seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0, "llm_wait_seconds": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "tool_calls": 0, "tool_seconds": 0.0,
+            "tool_errors": 0, "tool_cache_hits": 0}
+
+
+class CrewTracker:
+    """Raccoglie chiamate LLM, chiamate ai tools e durata dei task di un singolo run."""
+
+    def __init__(self, topic: str = None):
+        self.topic = topic
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.lock = threading.Lock()
+        self.llm_calls = []
+        self.tool_calls = []
+        self.tasks = []
+        self.stages = {}
+        self.last_task_end = None
+
+    @contextmanager
+    def activate(self):
+        token = current_tracker.set(self)
+        try:
+            with owner(PIPELINE, PIPELINE):
+                yield self
+        finally:
+            current_tracker.reset(token)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Misura una fase del run fuori dalla crew (es. raccolta delle fonti)."""
+        t0 = time.perf_counter()
+        try:
+            with owner(PIPELINE, name):  # I tools usati nella fase vanno a suo carico
+                yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - t0, 3)
+
+    def kickoff_started(self):
+        self.last_task_end = time.perf_counter()
+
+    def task_done(self, output):
+        """Callback dei task (Crew(task_callback=...)): in sequenza un task inizia quando finisce il precedente."""
+        now = time.perf_counter()
+        with self.lock:
+            self.tasks.append({
+                "task": output.name or output.description.strip().splitlines()[0],
+                "agent": output.agent,
+                "seconds": round(now - (self.last_task_end or self.t0), 3)
+            })
+            self.last_task_end = now
+
+    def add_llm_call(self, call: dict):
+        with self.lock:
+            self.llm_calls.append(call)
+
+    def add_tool_call(self, call: dict):
+        with self.lock:
+            self.tool_calls.append(call)
+
+    def summary(self) -> dict:
+        with self.lock:
+            by_agent = defaultdict(_bucket)
+            by_task = defaultdict(_bucket)
+            by_tool = defaultdict(_bucket)
+            for task in self.tasks:
+                by_task[task["task"]]["seconds"] += task["seconds"]
+                by_agent[task["agent"]]["seconds"] += task["seconds"]
+            for call in self.llm_calls:
+                for bucket in (by_agent[call["agent"]], by_task[call["task"]]):
+                    bucket["llm_calls"] += 1
+                    bucket["llm_seconds"] += call["seconds"]
+                    bucket["llm_wait_seconds"] += call["wait_seconds"]
+                    bucket["prompt_tokens"] += call["prompt_tokens"]
+                    bucket["completion_tokens"] += call["completion_tokens"]
+            for call in self.tool_calls:
+                for bucket in (by_agent[call["agent"]], by_task[call["task"]], by_tool[call["tool"]]):
+                    bucket["tool_calls"] += 1
+                    bucket["tool_seconds"] += call["seconds"]
+                    bucket["tool_errors"] += bool(call["error"])
+                    bucket["tool_cache_hits"] += bool(call["cached"])
+            for stage, seconds in self.stages.items():
+                by_task[stage]["seconds"] += seconds
+                by_agent[PIPELINE]["seconds"] += seconds
+            # Il tempo di un tool è già del suo task/agent: by_tool.seconds = tempo nel tool
+            for bucket in by_tool.values():
+                bucket["seconds"] = bucket["tool_seconds"]
+
+            def rounded(groups):
+                return {name: {key: round(value, 3) if isinstance(value, float) else value
+                               for key, value in bucket.items()}
+                        for name, bucket in groups.items()}
+
+            return {
+                "topic": self.topic,
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": round(time.perf_counter() - self.t0, 3),
+                "totals": {
+                    "llm_calls": len(self.llm_calls),
+                    "llm_seconds": round(sum(call["seconds"] for call in self.llm_calls), 3),
+                    "prompt_tokens": sum(call["prompt_tokens"] for call in self.llm_calls),
+                    "completion_tokens": sum(call["completion_tokens"] for call in self.llm_calls),
+                    "tool_calls": len(self.tool_calls),
+                    "tool_seconds": round(sum(call["seconds"] for call in self.tool_calls), 3)
+                },
+                "by_agent": rounded(by_agent),
+                "by_task": rounded(by_task),
+                "by_tool": rounded(by_tool),
+                "tasks": list(self.tasks),
+                "llm_calls": list(self.llm_calls),
+                "tool_calls": list(self.tool_calls)
+            }
+
+    def save(self, path: str, summary: dict = None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary or self.summary(), f, indent=2, ensure_ascii=False)
+
+
+def print_summary(summary: dict):
+    """Tabella per agent, task e tool (ordinata per tempo): dove se ne vanno minuti e token."""
+    header = f"{'':<32} {'tempo':>8} {'LLM':>4} {'LLM s':>7} {'attesa':>7} {'prompt':>8} {'compl.':>7} {'tools':>5} {'tools s':>7}"
+    for title, groups in (("Agent", summary["by_agent"]), ("Task", summary["by_task"]),
+                          ("Tool", summary["by_tool"])):
+        if not groups:
+            continue
+        print(f"\n{title}\n{header}")
+        for name, bucket in sorted(groups.items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{name[:32]:<32} {bucket['seconds']:>7.1f}s {bucket['llm_calls']:>4} "
+                  f"{bucket['llm_seconds']:>6.1f}s {bucket['llm_wait_seconds']:>6.1f}s "
+                  f"{bucket['prompt_tokens']:>8} {bucket['completion_tokens']:>7} "
+                  f"{bucket['tool_calls']:>5} {bucket['tool_seconds']:>6.1f}s")
+    totals = summary["totals"]
+    print(f"\n⏱️ {summary['wall_seconds']:.1f}s total, {totals['llm_calls']} LLM calls, "
+          f"{totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens")
+
+
+def _task_name(task) -> str:
+    if task is None:
+        return PIPELINE
+    return task.name or task.description.strip().splitlines()[0]
+
+
+@contextmanager
+def owner(agent: str, task: str):
+    """Attribuisce all'agent e al task le chiamate LLM e ai tools fatte nel blocco (stesso contesto)."""
+    token = _current_owner.set((agent, task))
+    try:
+        yield
+    finally:
+        _current_owner.reset(token)
+
+
+def _current_owner_or_pipeline() -> tuple:
+    return _current_owner.get() or (PIPELINE, PIPELINE)
+
+
+class TrackedAgent(Agent):
+    """Agent che, mentre esegue un task, lo rende il proprietario di chiamate LLM e tools.
+
+    I tools non ricevono agent e task da CrewAI: senza questo finirebbero a carico di chi
+    ha fatto l'ultima chiamata LLM, anche se era un'altra crew o un altro task.
+    """
+
+    def execute_task(self, task, *args, **kwargs):
+        with owner(self.role, _task_name(task)):
+            return super().execute_task(task, *args, **kwargs)
+
+
+def _usage_totals(crew_llm) -> tuple:
+    usage = crew_llm.get_token_usage_summary()
+    return usage.prompt_tokens, usage.completion_tokens
+
+
+def track_llm_calls(crew_llm):
+    """Misura ogni chiamata di un LLM CrewAI (tempo, attesa, token) nel tracker attivo."""
+    call = crew_llm.call
+    track_usage = getattr(crew_llm, "_track_token_usage_internal", None)
+    if track_usage is None:
+        print("⚠️ This crewai version does not report tokens per call: using the LLM totals "
+              "(approximate with parallel crews, see requirements.txt)")
+
+    @wraps(call)
+    def tracked_call(*args, **kwargs):
+        tracker = current_tracker.get()
+        if tracker is None:
+            return call(*args, **kwargs)
+        agent, task = _current_owner_or_pipeline()
+        if kwargs.get("from_agent") is not None:
+            agent = kwargs["from_agent"].role
+        if kwargs.get("from_task") is not None:
+            task = _task_name(kwargs["from_task"])
+        record = {
+            "agent": agent, "task": task,
+            "seconds": 0.0, "wait_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "error": None
+        }
+        token = _current_call.set(record)
+        before = _usage_totals(crew_llm) if track_usage is None else None
+        t0 = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["seconds"] = round(time.perf_counter() - t0, 3)
+            if before is not None:
+                after = _usage_totals(crew_llm)
+                record["prompt_tokens"] = after[0] - before[0]
+                record["completion_tokens"] = after[1] - before[1]
+            _current_call.reset(token)
+            tracker.add_llm_call(record)
+
+    def tracked_usage(usage_data: dict):
+        record = _current_call.get()
+        if record is not None:
+            record["prompt_tokens"] += usage_data.get("prompt_tokens") or 0
+            record["completion_tokens"] += usage_data.get("completion_tokens") or 0
+        return track_usage(usage_data)
+
+    crew_llm.call = tracked_call
+    if track_usage is not None:
+        crew_llm._track_token_usage_internal = tracked_usage
+    return crew_llm
+
+
+def record_llm_wait(seconds: float):
+    """Attesa di uno slot LLM (limite globale di chiamate) della chiamata in corso."""
+    record = _current_call.get()
+    if record is not None:
+        record["wait_seconds"] = round(record["wait_seconds"] + seconds, 3)
+
+
+@contextmanager
+def tool_span(tool: str, **attrs):
+    """Misura una chiamata a un tool; attrs e lo stato (es. cached) si aggiornano nel blocco."""
+    tracker = current_tracker.get()
+    agent, task = _current_owner_or_pipeline()
+    call = {"tool": tool, "agent": agent, "task": task, "seconds": 0.0, "cached": False, "error": None, **attrs}
+    t0 = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        call["seconds"] = round(time.perf_counter() - t0, 3)
+        if tracker:
+            tracker.add_tool_call(call)
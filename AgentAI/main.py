@@ -1,141 +1,234 @@
 # File: main.py
 # Parte 1: Imports e configurazione
 
+import hashlib
 import os
+import re
+import threading
+import time
+from functools import wraps
+
 from dotenv import load_dotenv
-from crewai import Agent, Task, Crew, Process
-from crewai_tools import SerperDevTool, ScrapeWebsiteTool
+from crewai import Task, Crew, Process
+from crewai.utilities.llm_utils import create_llm
 from langchain_openai import ChatOpenAI
 
 # Carica environment variables
 load_dotenv()
 
+from tools import search_tool, scrape_tool, collect_sources  # noqa: E402 - dopo load_dotenv (SERPER_API_KEY)
+from instrumentation import CrewTracker, TrackedAgent, print_summary, record_llm_wait, track_llm_calls  # noqa: E402
+
+# "pipeline": ricerche e scraping in parallelo prima della crew (con cache su disco)
+# "agent": il researcher cerca da solo, una chiamata ai tools alla volta
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "pipeline")
+# Chiamate LLM contemporanee al massimo, sommando tutte le crew del processo
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+OUTPUT_DIR = "output"
+# Lunghezza massima dei report passati da un task al successivo (contesto limitato a valle)
+REPORT_MAX_WORDS = int(os.getenv("RESEARCH_REPORT_MAX_WORDS", "800"))
+
 # Configura LLM (OpenAI)
 llm = ChatOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
     model="gpt-4o-mini"
 )
 
-print("✅ Configuration loaded")
-print(f"Using model: {llm.model_name}")
 
-# Parte 2: Inizializza tools
-search_tool = SerperDevTool()
-scrape_tool = ScrapeWebsiteTool()
-
-# Research Agent - cerca informazioni online
-researcher = Agent(
-    role="Senior Research Analyst",
-    goal="Discover cutting-edge developments in {topic}",
-    backstory="""You are an expert researcher with years of experience
-    in finding and analyzing technical information. You excel at finding
-    reliable sources and extracting key insights from complex data. Rispondi sempre in italiano.""",
-    verbose=True,
-    allow_delegation=False,
-    tools=[search_tool, scrape_tool],
-    llm=llm
-)
+def limit_llm_calls(crew_llm, max_in_flight: int):
+    """Limita le chiamate contemporanee di un LLM CrewAI con un semaforo condiviso."""
+    slots = threading.BoundedSemaphore(max_in_flight)
+    call = crew_llm.call
 
-print(f"✅ {researcher.role} created with {len(researcher.tools)} tools")
-
-# Analyst Agent - analizza dati del researcher
-analyst = Agent(
-    role="Content Analyst",
-    goal="Analyze research findings on {topic} and identify key insights",
-    backstory="""You're a meticulous analyst with a keen eye for detail.
-    You excel at synthesizing information from multiple sources and
-    identifying patterns, trends, and actionable insights. Rispondi sempre in italiano.""",
-    verbose=True,
-    allow_delegation=False,
-    llm=llm
-)
+    @wraps(call)
+    def limited_call(*args, **kwargs):
+        t0 = time.perf_counter()
+        with slots:
+            record_llm_wait(time.perf_counter() - t0)
+            return call(*args, **kwargs)
+
+    crew_llm.call = limited_call
+    return crew_llm
 
-# Writer Agent - scrive article finale
-writer = Agent(
-    role="Tech Content Writer",
-    goal="Write engaging technical article about {topic}",
-    backstory="""You're an acclaimed tech writer known for clear,
-    concise, and engaging content. You make complex technical topics
-    accessible to a wide audience without dumbing them down. Rispondi sempre in italiano.""",
-    verbose=True,
-    allow_delegation=False,
-    llm=llm
-)
 
-print(f"✅ All 3 agents created: Researcher, Analyst, Writer")
+# CrewAI converte il ChatOpenAI in un suo LLM (con il suo client OpenAI) per ogni agent:
+# lo convertiamo una volta sola, così tutte le crew condividono client, connessioni e limite
+crew_llm = track_llm_calls(limit_llm_calls(create_llm(llm), LLM_MAX_IN_FLIGHT))
 
-# Parte 3: Definiamo i tasks
-research_task = Task(
-    description="""Research the latest developments in {topic}.
+print("✅ Configuration loaded")
+print(f"Using model: {llm.model_name}")
+print(f"Research mode: {RESEARCH_MODE}")
+
+# Parte 2: Tools (search_tool e scrape_tool da tools.py, con cache su disco)
+
+# Parte 3: Agents e tasks
+RESEARCH_FOCUS = """
     Focus on:
     - Recent news and announcements (last 6 months)
     - Key technologies, frameworks, and tools
     - Industry trends and adoption rates
-    - Real-world use cases and applications
-    Find at least 5 reliable sources. rispondi sempre in italiano.""",
-    expected_output="Detailed research report with sources and URLs",
-    agent=researcher
-)
+    - Real-world use cases and applications"""
+
+if RESEARCH_MODE == "pipeline":
+    # Le fonti arrivano già raccolte: i tools servono solo per approfondire ciò che manca
+    research_description = """Research the latest developments in {topic}.""" + RESEARCH_FOCUS + """
+    Base the report on the sources below, citing their URLs. Use the tools only
+    if an important aspect is not covered. rispondi sempre in italiano.
+
+    SOURCES:
+    {sources}"""
+else:
+    research_description = """Research the latest developments in {topic}.""" + RESEARCH_FOCUS + """
+    Find at least 5 reliable sources. rispondi sempre in italiano."""
+
+
+def build_crew(verbose: bool = True, task_callback=None) -> Crew:
+    """Crea agents, tasks e crew per un run (LLM e tools sono condivisi tra le crew)."""
+    # Research Agent - cerca informazioni online
+    researcher = TrackedAgent(
+        role="Senior Research Analyst",
+        goal="Discover cutting-edge developments in {topic}",
+        backstory="""You are an expert researcher with years of experience
+        in finding and analyzing technical information. You excel at finding
+        reliable sources and extracting key insights from complex data. Rispondi sempre in italiano.""",
+        verbose=verbose,
+        allow_delegation=False,
+        tools=[search_tool, scrape_tool],
+        llm=crew_llm
+    )
+
+    # Analyst Agent - analizza dati del researcher
+    analyst = TrackedAgent(
+        role="Content Analyst",
+        goal="Analyze research findings on {topic} and identify key insights",
+        backstory="""You're a meticulous analyst with a keen eye for detail.
+        You excel at synthesizing information from multiple sources and
+        identifying patterns, trends, and actionable insights. Rispondi sempre in italiano.""",
+        verbose=verbose,
+        allow_delegation=False,
+        llm=crew_llm
+    )
+
+    # Writer Agent - scrive article finale
+    writer = TrackedAgent(
+        role="Tech Content Writer",
+        goal="Write engaging technical article about {topic}",
+        backstory="""You're an acclaimed tech writer known for clear,
+        concise, and engaging content. You make complex technical topics
+        accessible to a wide audience without dumbing them down. Rispondi sempre in italiano.""",
+        verbose=verbose,
+        allow_delegation=False,
+        llm=crew_llm
+    )
+
+    research_task = Task(
+        description=research_description,
+        expected_output=f"Detailed research report with sources and URLs, at most {REPORT_MAX_WORDS} words",
+        agent=researcher
+    )
+
+    analysis_task = Task(
+        description="""Analyze the research findings and identify:
+        - Top 3-5 most important trends
+        - Key players (companies, projects, tools)
+        - Practical implications for developers
+        - Challenges and limitations
+        Structure findings in clear, logical sections and keep the source URLs
+        next to the points they support. rispondi sempre in italiano.""",
+        expected_output=f"Structured analysis with key insights and trends, at most {REPORT_MAX_WORDS} words",
+        agent=analyst
+    )
+
+    # Writing task
+    writing_task = Task(
+        description="""Write a technical article about {topic}:
+        - Engaging introduction hook
+        - Clear explanation of key concepts
+        - Practical examples and use cases
+        - Current trends and future outlook
+        - Conclusion with key takeaways
+        Target: 800-1000 words, technical but accessible. rispondi sempre in italiano.""",
+        expected_output="Complete article in markdown format",
+        agent=writer,
+        # Solo l'analisi (che contiene già fonti e fatti salienti), non anche il report di ricerca
+        context=[analysis_task]
+    )
+
+    # Assembla la Crew
+    return Crew(
+        agents=[researcher, analyst, writer],
+        tasks=[research_task, analysis_task, writing_task],
+        process=Process.sequential,
+        verbose=verbose,
+        task_callback=task_callback
+    )
+
+
+# Parte 4: Funzioni di esecuzione
+def article_path(topic: str) -> str:
+    """File dell'articolo: slug leggibile + hash del topic ("C++" e "C#" hanno lo stesso slug)."""
+    topic = topic.strip()
+    slug = re.sub(r"[^\w-]+", "_", topic)
+    digest = hashlib.sha1(topic.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(OUTPUT_DIR, f"article_{slug}_{digest}.md")
+
+
+def report_path(topic: str) -> str:
+    """Report di tempi e token accanto all'articolo (article_X.md -> article_X.metrics.json)."""
+    return article_path(topic)[:-len(".md")] + ".metrics.json"
+
+
+def save_article(topic: str, content: str) -> str:
+    """Scrive l'articolo in modo atomico: un run interrotto non lascia file a metà."""
+    filename = article_path(topic)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    tmp = f"{filename}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, filename)
+    return filename
+
+
+def research(topic: str, verbose: bool = True):
+    """Esegue la crew su un topic e salva articolo e report; solleva le eccezioni al chiamante.
+
+    Ritorna (risultato, file dell'articolo, riepilogo di tempi e token).
+    """
+    tracker = CrewTracker(topic)
+    crew = build_crew(verbose, task_callback=tracker.task_done)
+    inputs = {'topic': topic}
+    with tracker.activate():
+        if RESEARCH_MODE == "pipeline":
+            with tracker.stage("collect_sources"):
+                inputs['sources'] = collect_sources(topic)
+        tracker.kickoff_started()
+        result = crew.kickoff(inputs=inputs)
+    filename = save_article(topic, str(result))
+    summary = tracker.summary()
+    tracker.save(report_path(topic), summary)
+    return result, filename, summary
 
-analysis_task = Task(
-    description="""Analyze the research findings and identify:
-    - Top 3-5 most important trends
-    - Key players (companies, projects, tools)
-    - Practical implications for developers
-    - Challenges and limitations
-    Structure findings in clear, logical sections. rispondi sempre in italiano.""",
-    expected_output="Structured analysis with key insights and trends",
-    agent=analyst
-)
-
-print(f"✅ Created {2} tasks (research + analysis)")
-
-# Writing task
-writing_task = Task(
-    description="""Write a technical article about {topic}:
-    - Engaging introduction hook
-    - Clear explanation of key concepts
-    - Practical examples and use cases
-    - Current trends and future outlook
-    - Conclusion with key takeaways
-    Target: 800-1000 words, technical but accessible. rispondi sempre in italiano.""",
-    expected_output="Complete article in markdown format",
-    agent=writer
-)
 
-# Assembla la Crew
-crew = Crew(
-    agents=[researcher, analyst, writer],
-    tasks=[research_task, analysis_task, writing_task],
-    process=Process.sequential,
-    verbose=True
-)
-
-print(f"✅ Crew assembled with {len(crew.tasks)} tasks")
-
-# Parte 4: Funzione esecuzione principale
 def run_research(topic):
     """Esegue ricerca multi-agent su un topic"""
     print(f"\n{'='*60}")
     print(f"🚀 Starting AI research on: {topic}")
     print(f"{'='*60}")
-    print("\nThis will take 2-5 minutes...\n")
-    
+    if RESEARCH_MODE == "pipeline":
+        print("\nCollecting sources in parallel, then 1-2 minutes of writing...\n")
+    else:
+        print("\nThis will take 2-5 minutes...\n")
+
     try:
-        result = crew.kickoff(inputs={'topic': topic})
-        
-        # Salva su file
-        filename = f"output/article_{topic.replace(' ', '_')}.md"
-        os.makedirs('output', exist_ok=True)
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(str(result))
-        
+        result, filename, summary = research(topic)
+
         print(f"\n{'='*60}")
+        print_summary(summary)
         print(f"✅ Article saved to: {filename}")
+        print(f"📊 Metrics saved to: {report_path(topic)}")
         print(f"{'='*60}")
         return result
-        
+
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
@@ -145,18 +238,18 @@ if __name__ == "__main__":
     print("\n" + "="*60)
     print("   CrewAI Multi-Agent Research System")
     print("="*60)
-    
+
     topic = input("\nEnter research topic: ").strip()
-    
+
     if not topic:
         print("❌ Topic cannot be empty")
         exit(1)
-    
+
     result = run_research(topic)
-    
+
     if result:
         print("\n📄 Preview (first 500 chars):")
         print("-" * 60)
         print(str(result)[:500] + "...")
         print("-" * 60)
-        print("\n✅ Done! Check the output folder for full article.")
\ No newline at end of file
+        print("\n✅ Done! Check the output folder for full article.")
@@ -0,0 +1,141 @@
+# File: tools.py
+# Tools del researcher con cache su disco e raccolta parallela delle fonti (modalità pipeline)
+# Le pagine arrivano agli agent già ripulite (vedi content.py)
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any
+
+import requests
+from crewai_tools import SerperDevTool, ScrapeWebsiteTool
+
+from cache import cache, make_key
+from content import TOKEN_BUDGET, build_dossier, extract_text
+from instrumentation import tool_span
+
+MAX_WORKERS = int(os.getenv("RESEARCH_MAX_WORKERS", "8"))             # Ricerche/scraping in parallelo
+MAX_SOURCES = int(os.getenv("RESEARCH_MAX_SOURCES", "8"))             # Pagine da leggere per topic
+# Testo massimo di una pagina letta dal researcher con il tool (circa 2000 token)
+SCRAPE_MAX_CHARS = int(os.getenv("RESEARCH_SCRAPE_MAX_CHARS", "8000"))
+
+# Una ricerca per ogni punto del research task: partono tutte insieme
+SEARCH_QUERIES = [
+    ("{topic} latest news announcements", "news"),
+    ("{topic} key technologies frameworks tools", "search"),
+    ("{topic} industry trends adoption", "search"),
+    ("{topic} real-world use cases applications", "search"),
+]
+
+
+def _never_cache(arguments, result) -> bool:
+    """cache_function dei tools: la cache (su disco) è la nostra. Con quella in memoria di CrewAI
+    un risultato già visto salterebbe _run, e quindi tool_span: la chiamata non verrebbe contata."""
+    return False
+
+
+class CachedSerperDevTool(SerperDevTool):
+    """SerperDevTool con cache su disco per query, tipo di ricerca e numero di risultati."""
+
+    def _run(self, **kwargs: Any):
+        query = kwargs.get("search_query") or kwargs.get("query")
+        search_type = kwargs.get("search_type", self.search_type)
+        key = make_key(query, search_type, self.n_results, self.country, self.location, self.locale)
+        with tool_span("serper_search", query=query) as span:
+            if cache and query:
+                cached = cache.get("search", key)
+                if cached is not None:
+                    span["cached"] = True
+                    return cached
+            # Gli errori si propagano e non vengono messi in cache
+            results = super()._run(**kwargs)
+            if cache and query:
+                cache.set("search", key, results)
+            return results
+
+
+class CachedScrapeWebsiteTool(ScrapeWebsiteTool):
+    """ScrapeWebsiteTool che estrae solo il testo principale della pagina, con cache su disco per URL."""
+
+    def fetch(self, url: str) -> str:
+        """Testo pulito della pagina (intero); solleva eccezione se il download fallisce."""
+        key = make_key(url)
+        with tool_span("scrape_website", url=url) as span:
+            if cache:
+                cached = cache.get("page", key)
+                if cached is not None:
+                    span["cached"] = True
+                    return cached
+            page = requests.get(url, timeout=15, headers=self.headers, cookies=self.cookies or {})
+            # Le pagine di errore non diventano "contenuto" e non finiscono in cache
+            page.raise_for_status()
+            page.encoding = page.apparent_encoding
+            text = extract_text(page.text)
+            if cache:
+                cache.set("page", key, text)
+            return text
+
+    def _run(self, **kwargs: Any):
+        url = kwargs.get("website_url", self.website_url)
+        if url is None:
+            raise ValueError("Website URL must be provided.")
+        text = self.fetch(url)
+        if len(text) > SCRAPE_MAX_CHARS:
+            text = text[:SCRAPE_MAX_CHARS] + "\n[...]"
+        return "The following text is scraped website content:\n\n" + text
+
+
+# Istanze condivise (anche dal researcher, per eventuali approfondimenti)
+search_tool = CachedSerperDevTool(cache_function=_never_cache)
+scrape_tool = CachedScrapeWebsiteTool(cache_function=_never_cache)
+
+
+def _search(query: str, search_type: str) -> list:
+    """Risultati (titolo, link, snippet, data) di una ricerca; lista vuota se fallisce."""
+    try:
+        results = search_tool.run(search_query=query, search_type=search_type)
+    except Exception as e:
+        print(f"⚠️ Search failed ({query}): {e}")
+        return []
+    return results.get("news" if search_type == "news" else "organic", [])
+
+
+def _scrape(url: str) -> str:
+    try:
+        return scrape_tool.fetch(url)
+    except Exception as e:
+        print(f"⚠️ Scrape failed ({url}): {e}")
+        return ""
+
+
+def _pick_sources(result_lists: list, limit: int) -> list:
+    """Alterna i risultati delle ricerche (un po' di ogni aspetto) senza URL duplicati."""
+    sources = []
+    seen = set()
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank >= len(results) or len(sources) >= limit:
+                continue
+            result = results[rank]
+            link = result.get("link")
+            if link and link not in seen:
+                seen.add(link)
+                sources.append(result)
+    return sources
+
+
+def collect_sources(topic: str, max_sources: int = MAX_SOURCES, budget: int = TOKEN_BUDGET) -> str:
+    """Fase di ricerca senza LLM: ricerche e scraping in parallelo, poi un dossier entro il budget."""
+    queries = [(template.format(topic=topic), search_type) for template, search_type in SEARCH_QUERIES]
+    # copy_context: le chiamate nei thread finiscono nel tracker del run (instrumentation)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [pool.submit(copy_context().run, _search, *query) for query in queries]
+        result_lists = [future.result() for future in futures]
+        sources = _pick_sources(result_lists, max_sources)
+        futures = [pool.submit(copy_context().run, _scrape, source["link"]) for source in sources]
+        pages = [future.result() for future in futures]
+
+    dossier = build_dossier(sources, pages, topic, budget)
+    print(f"🔎 {len(queries)} searches, {len(sources)} sources scraped, "
+          f"~{len(''.join(pages)) // 4} -> ~{len(dossier) // 4} tokens")
+    return dossier
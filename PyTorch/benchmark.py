@@ -0,0 +1,84 @@
+# benchmark.py
+# Confronto backend: parità dei logits con PyTorch + latenza/throughput su CPU
+# Uso: python benchmark.py [recensioni.txt]
+# La parità è un controllo bloccante: fallisce (AssertionError) se l'int8 devia troppo
+import os
+import sys
+import time
+import numpy as np
+from inference import load_backend, tokenizer, _forward_buckets, MAX_LENGTH, BATCH_SIZE
+from export_onnx import ONNX_PATH, ONNX_INT8_PATH
+
+SAMPLE_REVIEWS = [
+    "This movie was absolutely wonderful, the acting was superb and the story moving.",
+    "Terrible film. I walked out after thirty minutes and wanted my money back.",
+    "An average plot, but the soundtrack and photography make it worth watching.",
+    "I have never been so bored in a cinema. Flat characters and a predictable ending.",
+    "A masterpiece of modern cinema: funny, clever, and surprisingly emotional " * 8,
+    "The first half drags a bit, yet the final act is one of the best I've seen in years.",
+]
+
+# Tolleranze di parità rispetto ai logits PyTorch
+PARITY_ATOL = {"onnx": 1e-3, "onnx-int8": 0.5}
+MIN_LABEL_AGREEMENT = {"onnx": 1.0, "onnx-int8": 0.95}
+
+def assert_parity(backend, sequences, reference):
+    """Confronta i logits del backend con quelli PyTorch; AssertionError se fuori tolleranza."""
+    logits = _forward_buckets(sequences, run=load_backend(backend))
+    max_diff = (logits - reference).abs().max().item()
+    agreement = (logits.argmax(-1) == reference.argmax(-1)).float().mean().item()
+    ok = max_diff <= PARITY_ATOL[backend] and agreement >= MIN_LABEL_AGREEMENT[backend]
+    print(f"{'✓' if ok else '✗'} Parità {backend}: max |Δlogit| = {max_diff:.5f}, "
+          f"label uguali = {agreement:.2%}")
+    if not ok:  # Non un assert: deve valere anche con python -O
+        raise AssertionError(f"Backend {backend} fuori tolleranza: max |Δlogit| {max_diff:.5f} "
+                             f"(max {PARITY_ATOL[backend]}), label uguali {agreement:.2%} "
+                             f"(min {MIN_LABEL_AGREEMENT[backend]:.0%})")
+
+def exported_backends():
+    return [name for name, path in (("onnx", ONNX_PATH), ("onnx-int8", ONNX_INT8_PATH)) if os.path.exists(path)]
+
+def verify_parity(texts=SAMPLE_REVIEWS):
+    """Verifica tutti i backend ONNX esportati contro PyTorch (usata anche dopo l'export)."""
+    sequences = tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)["input_ids"]
+    reference = _forward_buckets(sequences, run=load_backend("torch"))
+    for backend in exported_backends():
+        assert_parity(backend, sequences, reference)
+
+def benchmark(backend, sequences, batch_size=BATCH_SIZE, repeats=5):
+    """Misura latenza per batch (p50/p95) e throughput in recensioni/secondo."""
+    run = load_backend(backend)
+    _forward_buckets(sequences[:batch_size], batch_size, run)  # Warm-up
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(sequences), batch_size):
+            t0 = time.perf_counter()
+            _forward_buckets(sequences[i:i + batch_size], batch_size, run)
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    throughput = len(sequences) * repeats / elapsed
+    print(f"{backend:>10}: p50 {np.percentile(latencies, 50) * 1000:7.1f} ms/batch, "
+          f"p95 {np.percentile(latencies, 95) * 1000:7.1f} ms/batch, {throughput:7.1f} recensioni/s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_REVIEWS * 32
+
+    backends = ["torch"] + exported_backends()
+    print(f"Recensioni: {len(texts)}, backend: {', '.join(backends)}\n")
+
+    # Un modello quantizzato che non rispetta le tolleranze interrompe lo script (exit code 1)
+    print("=== PARITÀ (vs PyTorch) ===")
+    verify_parity(texts)
+
+    print("\n=== BENCHMARK ===")
+    sequences = tokenizer(texts, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+    for backend in backends:
+        benchmark(backend, sequences)
@@ -0,0 +1,53 @@
+# export_onnx.py
+# Export del modello sentiment in ONNX (float32) + variante quantizzata int8
+import os
+import torch
+from sentiment_backend import onnx_paths
+
+ONNX_PATH, ONNX_INT8_PATH = onnx_paths()
+
+def export_onnx(model, tokenizer, onnx_path=ONNX_PATH, int8_path=ONNX_INT8_PATH, check_parity=True):
+    """Esporta il modello in ONNX con batch e lunghezza dinamici, poi lo quantizza in int8.
+
+    Con check_parity=True confronta subito i modelli esportati con PyTorch (benchmark.verify_parity)
+    e fallisce con AssertionError se i logits o le label si discostano oltre la tolleranza.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    model = model.to("cpu").eval()
+    dummy = tokenizer(["Export ONNX del modello sentiment"], return_tensors="pt")
+
+    torch.onnx.export(
+        model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=17,
+    )
+    print(f"✓ ONNX salvato in {onnx_path}")
+
+    # Quantizzazione dinamica: pesi int8, attivazioni quantizzate a runtime
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"✓ ONNX int8 salvato in {int8_path}")
+
+    if check_parity:
+        # Import qui: benchmark carica il modello salvato in ./sentiment-model
+        from benchmark import verify_parity
+        verify_parity()
+
+
+# Export standalone da un modello già addestrato
+if __name__ == "__main__":
+    from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+    print("Caricamento modello...")
+    model = DistilBertForSequenceClassification.from_pretrained("./sentiment-model")
+    tokenizer = DistilBertTokenizerFast.from_pretrained("./sentiment-model")
+    export_onnx(model, tokenizer)
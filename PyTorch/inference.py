@@ -1,50 +1,91 @@
 # inference.py
+import os
+import sys
 import torch
-from transformers import DistilBertTokenizer, DistilBertForSequenceClassification
+from transformers import DistilBertTokenizerFast
+from sentiment_backend import MODEL_DIR, LABELS, load_backend, forward_buckets
+
+MAX_LENGTH = 512
+BATCH_SIZE = 32
+WINDOW_STRIDE = 128  # Token in comune tra finestre consecutive (sliding window)
+# Backend: "torch" (eager float32), "onnx" (ONNX Runtime float32), "onnx-int8" (quantizzato)
+BACKEND = os.getenv("SENTIMENT_BACKEND", "torch")
 
 # Carica modello fine-tuned
-print("Caricamento modello...")
-model = DistilBertForSequenceClassification.from_pretrained("./sentiment-model")
-tokenizer = DistilBertTokenizer.from_pretrained("./sentiment-model")
-model.eval()  # Modalità valutazione (disabilita dropout)
+print(f"Caricamento modello (backend: {BACKEND})...")
+forward = load_backend(BACKEND)
+# Tokenizer "fast" (Rust): tokenizza intere liste di testi in un colpo solo
+tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_DIR)
+
+def _forward_buckets(sequences, batch_size=BATCH_SIZE, run=None):
+    """Esegue il modello (di default il backend caricato) con bucket per lunghezza e padding dinamico."""
+    return forward_buckets(run or forward, sequences, tokenizer.pad_token_id, batch_size)
+
+def _to_predictions(logits):
+    """Softmax + argmax in un solo passaggio su tutto il batch."""
+    confidences, predictions = torch.softmax(logits, dim=-1).max(dim=-1)
+    return [(LABELS[p], c) for p, c in zip(predictions.tolist(), confidences.tolist())]
+
+def _aggregate_windows(window_logits, doc_ids, window_lengths, num_docs):
+    """Media dei logits delle finestre di ogni documento, pesata sul numero di token."""
+    weights = torch.tensor(window_lengths, dtype=torch.float).unsqueeze(-1)
+    doc_ids = torch.tensor(doc_ids, dtype=torch.long)
+    with torch.inference_mode():
+        sums = torch.zeros(num_docs, len(LABELS)).index_add_(0, doc_ids, window_logits * weights)
+        totals = torch.zeros(num_docs, 1).index_add_(0, doc_ids, weights)
+        return sums / totals
+
+def predict_batch(texts, batch_size=BATCH_SIZE, sliding_window=False):
+    """Classifica una lista di testi, ritorna [(sentiment, confidence), ...] nello stesso ordine.
+
+    Con sliding_window=True i testi oltre MAX_LENGTH token non vengono troncati:
+    sono divisi in finestre di al massimo MAX_LENGTH token, due finestre consecutive hanno
+    WINDOW_STRIDE token in comune; le finestre di tutti i testi passano nel modello
+    insieme e i loro logits sono aggregati per documento.
+    """
+    if not texts:
+        return []
+    if not sliding_window:
+        encodings = tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)
+        return _to_predictions(_forward_buckets(encodings["input_ids"], batch_size))
+
+    encodings = tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH,
+                          stride=WINDOW_STRIDE, return_overflowing_tokens=True)
+    windows = encodings["input_ids"]
+    window_logits = _forward_buckets(windows, batch_size)
+    logits = _aggregate_windows(window_logits, encodings["overflow_to_sample_mapping"],
+                                [len(ids) for ids in windows], len(texts))
+    return _to_predictions(logits)
 
 def predict_sentiment(text):
-    # Tokenizza input
-    inputs = tokenizer(
-        text,
-        return_tensors="pt",
-        truncation=True,
-        max_length=512
-    )
-    
-    # Predizione (no gradients)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits
-        prediction = torch.argmax(logits, dim=-1).item()
-    
-    # Converti in label
-    sentiment = "POSITIVE" if prediction == 1 else "NEGATIVE"
-    confidence = torch.softmax(logits, dim=-1)[0][prediction].item()
-    
-    return sentiment, confidence
+    return predict_batch([text])[0]
 
 
 # Main loop interattivo
 if __name__ == "__main__":
+    # Modalità batch: python inference.py recensioni.txt [--window] (una recensione per riga)
+    args = [arg for arg in sys.argv[1:] if arg != "--window"]
+    if args:
+        with open(args[0], encoding="utf-8") as f:
+            reviews = [line.strip() for line in f if line.strip()]
+        predictions = predict_batch(reviews, sliding_window="--window" in sys.argv)
+        for review, (sentiment, confidence) in zip(reviews, predictions):
+            print(f"{sentiment}\t{confidence:.2%}\t{review[:80]}")
+        sys.exit(0)
+
     print("\n=== Sentiment Analyzer ===")
     print("Scrivi una recensione (o 'quit' per uscire)\n")
-    
+
     while True:
         text = input("Recensione: ")
-        
+
         if text.lower() in ['quit', 'exit', 'q']:
             break
-        
+
         if not text.strip():
             continue
-        
+
         sentiment, confidence = predict_sentiment(text)
         print(f"→ {sentiment} (confidence: {confidence:.2%})\n")
-    
-    print("Arrivederci!")
\ No newline at end of file
+
+    print("Arrivederci!")
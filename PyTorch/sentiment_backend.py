@@ -0,0 +1,69 @@
+# sentiment_backend.py
+# Backend del modello sentiment e forward con padding dinamico, condivisi da inference.py,
+# benchmark.py e dal gateway (gateway/models.py): qui non si carica nessun modello all'import
+import os
+import torch
+
+MODEL_DIR = "./sentiment-model"
+LABELS = ["NEGATIVE", "POSITIVE"]
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def onnx_paths(model_dir=MODEL_DIR):
+    """Percorsi dei modelli ONNX float32 e int8 esportati accanto al modello PyTorch."""
+    onnx_dir = os.path.join(model_dir, "onnx")
+    return os.path.join(onnx_dir, "model.onnx"), os.path.join(onnx_dir, "model-int8.onnx")
+
+def load_backend(backend, model_dir=MODEL_DIR):
+    """Ritorna una funzione (input_ids, attention_mask) -> logits per il backend scelto.
+
+    backend: "torch" (eager float32), "onnx" (ONNX Runtime float32), "onnx-int8" (quantizzato)
+    """
+    if backend == "torch":
+        from transformers import DistilBertForSequenceClassification
+
+        model = DistilBertForSequenceClassification.from_pretrained(model_dir)
+        model.eval()  # Modalità valutazione (disabilita dropout)
+
+        def run(input_ids, attention_mask):
+            return model(input_ids=input_ids, attention_mask=attention_mask).logits
+        return run
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend sconosciuto: {backend}")
+
+    import onnxruntime as ort
+    onnx_path, int8_path = onnx_paths(model_dir)
+    session = ort.InferenceSession(int8_path if backend == "onnx-int8" else onnx_path,
+                                   providers=["CPUExecutionProvider"])
+
+    def run(input_ids, attention_mask):
+        (logits,) = session.run(["logits"], {
+            "input_ids": input_ids.numpy(),
+            "attention_mask": attention_mask.numpy(),
+        })
+        return torch.from_numpy(logits)
+    return run
+
+def length_buckets(lengths, batch_size):
+    """Ordina gli indici per lunghezza e li divide in bucket da batch_size."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def pad(sequences, pad_token_id):
+    """Padding dinamico: solo fino alla sequenza più lunga del bucket."""
+    max_len = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), max_len), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+def forward_buckets(run, sequences, pad_token_id, batch_size):
+    """Esegue il modello bucket per bucket; ritorna i logits nell'ordine originale."""
+    with torch.inference_mode():
+        logits = torch.empty(len(sequences), len(LABELS))
+        for bucket in length_buckets([len(ids) for ids in sequences], batch_size):
+            input_ids, attention_mask = pad([sequences[i] for i in bucket], pad_token_id)
+            logits[bucket] = run(input_ids, attention_mask)
+    return logits
@@ -0,0 +1,211 @@
+# server.py
+# Servizio HTTP per il sentiment con micro-batching delle richieste concorrenti
+#
+# Sviluppo:   python server.py
+# Produzione: WEB_CONCURRENCY=2 gunicorn -w 2 --threads 32 -b 0.0.0.0:8000 server:app
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import torch
+from flask import Flask, request, jsonify, Response
+
+# Thread intra-op per processo: i core vengono divisi tra i worker,
+# altrimenti N worker x N thread si contendono la CPU
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", max(1, (os.cpu_count() or 1) // WORKERS)))
+torch.set_num_threads(NUM_THREADS)
+
+from inference import predict_batch  # Carica ./sentiment-model una sola volta per processo
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))       # Testi per forward pass
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "10"))           # Attesa massima per riempire un batch
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "256"))                # Richieste in coda prima del 429
+MAX_TEXTS_PER_REQUEST = int(os.getenv("MAX_TEXTS_PER_REQUEST", "256"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+
+
+class LatencyHistogram:
+    """Istogramma cumulativo in formato Prometheus (thread-safe)."""
+
+    def __init__(self, name, help_text, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def render(self):
+        with self.lock:
+            lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+            for bound, count in zip(self.buckets, self.counts):
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.total}")
+            lines.append(f"{self.name}_count {self.count}")
+        return "\n".join(lines)
+
+
+REQUEST_LATENCY = LatencyHistogram("sentiment_request_seconds", "Latenza end-to-end delle richieste /predict")
+QUEUE_WAIT = LatencyHistogram("sentiment_queue_wait_seconds", "Attesa in coda prima del forward pass")
+BATCH_LATENCY = LatencyHistogram("sentiment_batch_seconds", "Durata di un forward pass")
+BATCH_SIZE = LatencyHistogram("sentiment_batch_size", "Testi per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+class MicroBatcher:
+    """Raccoglie le richieste concorrenti in una coda limitata e le esegue in un unico forward pass."""
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.rejected_total = 0   # Richieste rifiutate con coda piena
+        self.expired_total = 0    # Richieste scadute o abbandonate prima del forward pass
+
+    def submit(self, texts, timeout=REQUEST_TIMEOUT):
+        """Accoda i testi e ritorna un Future; solleva queue.Full se il servizio è saturo.
+
+        Dopo timeout secondi in coda la richiesta non viene più eseguita; il chiamante che
+        smette di attendere prima deve annullare il Future (future.cancel()).
+        """
+        self._ensure_started()
+        future = Future()
+        enqueued_at = time.perf_counter()
+        try:
+            self.queue.put_nowait((texts, future, enqueued_at, enqueued_at + timeout))
+        except queue.Full:
+            with self.lock:
+                self.rejected_total += 1
+            raise
+        return future
+
+    def _ensure_started(self):
+        # Avvio lazy: il thread deve nascere nel processo worker (dopo l'eventuale fork)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+
+    def _accept(self, item):
+        """Prende in carico una richiesta; False se è stata annullata o è scaduta in coda."""
+        _, future, _, expires_at = item
+        # set_running_or_notify_cancel: da qui in poi il chiamante non può più annullarla
+        if future.set_running_or_notify_cancel():
+            if time.perf_counter() <= expires_at:
+                return True
+            future.set_exception(FutureTimeout())
+        with self.lock:
+            self.expired_total += 1
+        return False
+
+    def _collect(self):
+        """Attende la prima richiesta valida, poi raccoglie le altre fino a batch pieno o timeout."""
+        items = []
+        while not items:
+            item = self.queue.get()
+            if self._accept(item):
+                items.append(item)
+        size = len(items[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if self._accept(item):
+                items.append(item)
+                size += len(item[0])
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            start = time.perf_counter()
+            for _, _, enqueued_at, _ in items:
+                QUEUE_WAIT.observe(start - enqueued_at)
+
+            texts = [text for item_texts, _, _, _ in items for text in item_texts]
+            try:
+                results = self.predict_fn(texts)
+            except Exception as e:
+                for _, future, _, _ in items:
+                    future.set_exception(e)
+                continue
+            BATCH_LATENCY.observe(time.perf_counter() - start)
+            BATCH_SIZE.observe(len(texts))
+
+            # Ridistribuisci i risultati alle richieste originali
+            offset = 0
+            for item_texts, future, _, _ in items:
+                future.set_result(results[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+app = Flask(__name__)
+batcher = MicroBatcher(predict_batch)
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    start = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': "Il body deve essere un oggetto JSON con 'text' o 'texts'"}), 400
+    single = "text" in data
+    texts = [data["text"]] if single else data.get("texts", [])
+
+    # Una stringa verrebbe classificata carattere per carattere, un numero darebbe un 500
+    if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': "Serve 'text' (stringa) o 'texts' (lista di stringhe)"}), 400
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        return jsonify({'error': f"Massimo {MAX_TEXTS_PER_REQUEST} testi per richiesta"}), 413
+
+    try:
+        future = batcher.submit(texts)
+    except queue.Full:
+        response = jsonify({'error': 'Servizio sovraccarico, riprova'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+
+    try:
+        results = future.result(timeout=REQUEST_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()  # Se è ancora in coda il batcher la scarta
+        return jsonify({'error': 'Timeout'}), 503
+
+    REQUEST_LATENCY.observe(time.perf_counter() - start)
+    predictions = [{'sentiment': s, 'confidence': c} for s, c in results]
+    return jsonify(predictions[0] if single else {'results': predictions})
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok', 'queue': batcher.queue.qsize(), 'torch_threads': NUM_THREADS})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body = "\n".join(h.render() for h in (REQUEST_LATENCY, QUEUE_WAIT, BATCH_LATENCY, BATCH_SIZE))
+    with batcher.lock:
+        counters = {"rejected": batcher.rejected_total, "expired": batcher.expired_total}
+    for name, value in counters.items():
+        body += f"\n# TYPE sentiment_{name}_total counter\nsentiment_{name}_total {value}"
+    body += "\n"
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+if __name__ == '__main__':
+    app.run(port=8000, threaded=True)
@@ -1,33 +1,63 @@
 # train.py - File Completo
+import hashlib
+import json
+import os
 import torch
 import numpy as np
-from transformers import DistilBertTokenizer, DistilBertForSequenceClassification
-from transformers import Trainer, TrainingArguments
-from datasets import load_dataset
-
-# Carica dataset
-print("Caricamento dataset IMDB...")
-dataset = load_dataset("imdb")
-train_dataset = dataset["train"].shuffle(seed=42).select(range(1000))
-test_dataset = dataset["test"].shuffle(seed=42).select(range(200))
-print(f"Training: {len(train_dataset)}, Test: {len(test_dataset)}")
+from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+from transformers import Trainer, TrainingArguments, DataCollatorWithPadding
+from datasets import load_dataset, load_from_disk, DatasetDict
+from export_onnx import export_onnx
+
+BASE_MODEL = "distilbert-base-uncased"
+DATASET = "imdb"
+TRAIN_SIZE, TEST_SIZE, SEED = 1000, 200, 42
+MAX_LENGTH = 512
+# Batch effettivo = per_device_train_batch_size * GRAD_ACCUM_STEPS
+GRAD_ACCUM_STEPS = int(os.getenv("GRAD_ACCUM_STEPS", "1"))
 
 # Tokenization
 print("Caricamento tokenizer...")
-tokenizer = DistilBertTokenizer.from_pretrained("distilbert-base-uncased")
+tokenizer = DistilBertTokenizerFast.from_pretrained(BASE_MODEL)
+
+# Cache su disco della tokenizzazione, una cartella per combinazione di impostazioni:
+# cambiando tokenizer, max_length o dataset non si riusano token vecchi
+TOKENIZED_SETTINGS = {"tokenizer": BASE_MODEL, "vocab_size": tokenizer.vocab_size, "max_length": MAX_LENGTH,
+                      "dataset": DATASET, "train_size": TRAIN_SIZE, "test_size": TEST_SIZE, "seed": SEED}
+fingerprint = hashlib.sha256(json.dumps(TOKENIZED_SETTINGS, sort_keys=True).encode()).hexdigest()[:12]
+TOKENIZED_DIR = f"./tokenized-{DATASET}-{fingerprint}"
 
 def tokenize_function(examples):
-    return tokenizer(examples["text"], padding="max_length", truncation=True, max_length=512)
+    # Nessun padding qui: lo fa il data collator, batch per batch
+    return tokenizer(examples["text"], truncation=True, max_length=MAX_LENGTH)
 
-print("Tokenizzazione...")
-train_dataset = train_dataset.map(tokenize_function, batched=True)
-test_dataset = test_dataset.map(tokenize_function, batched=True)
-train_dataset.set_format("torch", columns=["input_ids", "attention_mask", "label"])
-test_dataset.set_format("torch", columns=["input_ids", "attention_mask", "label"])
+if os.path.isdir(TOKENIZED_DIR):
+    print(f"Caricamento dataset tokenizzato da {TOKENIZED_DIR}...")
+    tokenized = load_from_disk(TOKENIZED_DIR)
+else:
+    # Carica dataset
+    print(f"Caricamento dataset {DATASET}...")
+    dataset = load_dataset(DATASET)
+    tokenized = DatasetDict({
+        "train": dataset["train"].shuffle(seed=SEED).select(range(TRAIN_SIZE)),
+        "test": dataset["test"].shuffle(seed=SEED).select(range(TEST_SIZE)),
+    })
+    print("Tokenizzazione...")
+    tokenized = tokenized.map(tokenize_function, batched=True, remove_columns=["text"])
+    tokenized.save_to_disk(TOKENIZED_DIR)
+    with open(os.path.join(TOKENIZED_DIR, "settings.json"), "w") as f:
+        json.dump(TOKENIZED_SETTINGS, f, indent=2)
+
+train_dataset = tokenized["train"]
+test_dataset = tokenized["test"]
+print(f"Training: {len(train_dataset)}, Test: {len(test_dataset)}")
+
+# Padding dinamico: ogni batch viene paddato alla sequenza più lunga che contiene
+data_collator = DataCollatorWithPadding(tokenizer=tokenizer)
 
 # Modello
 print("Caricamento modello...")
-model = DistilBertForSequenceClassification.from_pretrained("distilbert-base-uncased", num_labels=2)
+model = DistilBertForSequenceClassification.from_pretrained(BASE_MODEL, num_labels=2)
 
 # Metrica per accuracy
 def compute_metrics(eval_pred):
@@ -37,14 +67,17 @@ def compute_metrics(eval_pred):
     return {"accuracy": accuracy}
 
 # Training arguments
+# group_by_length: batch di recensioni di lunghezza simile -> quasi zero token di padding
 training_args = TrainingArguments(
     output_dir="./results", eval_strategy="epoch", learning_rate=2e-5,
     per_device_train_batch_size=8, per_device_eval_batch_size=8,
+    gradient_accumulation_steps=GRAD_ACCUM_STEPS, train_sampling_strategy="group_by_length",
     num_train_epochs=3, weight_decay=0.01, save_strategy="epoch"
 )
 
 # Trainer
-trainer = Trainer(model=model, args=training_args, train_dataset=train_dataset, eval_dataset=test_dataset, compute_metrics=compute_metrics)
+trainer = Trainer(model=model, args=training_args, train_dataset=train_dataset, eval_dataset=test_dataset,
+                  data_collator=data_collator, compute_metrics=compute_metrics)
 
 # Train & Evaluate
 print("\n=== TRAINING ===")
@@ -56,4 +89,8 @@ print(f"Accuracy: {results['eval_accuracy']:.2%}, Loss: {results['eval_loss']:.4
 # Save
 model.save_pretrained("./sentiment-model")
 tokenizer.save_pretrained("./sentiment-model")
-print("✓ Modello salvato")
\ No newline at end of file
+print("✓ Modello salvato")
+
+# Export ONNX + int8 per l'inferenza su CPU con ONNX Runtime
+print("\n=== EXPORT ONNX ===")
+export_onnx(model, tokenizer)
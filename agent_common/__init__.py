@@ -0,0 +1,6 @@
+# File: __init__.py
+# Codice condiviso dai due agenti di viaggio (longchainProject e langchain-agent-workshop-local-ollama):
+# tracing, record/replay HTTP, benchmark e cache semantica delle risposte.
+#
+# I progetti non sono pacchetti installati: ogni modulo che importa da qui aggiunge
+# la root del repo a sys.path (vedi l'import di agent_common nei moduli dei progetti).
@@ -0,0 +1,135 @@
+# File: benchmark.py
+# Runner del benchmark riproducibile degli agenti: replay offline di LLM e API con latenza simulata
+#
+# Ogni progetto ha il suo benchmark.py con domande, latenza LLM di default e pulizia tra
+# le ripetizioni, e chiama run_benchmark. Uso (dalla cartella del progetto):
+# 1. Registra le fixture (una volta, con rete e LLM raggiungibile):
+#        python benchmark.py --record
+# 2. Misura offline (nessuna chiamata esterna, latenze finte ma costanti):
+#        python benchmark.py --repeat 5 --http-latency 0.1 --save results.json
+# 3. Confronta con un run precedente (exit code 1 se peggiora):
+#        python benchmark.py --baseline results.json
+#
+# Se il prompt o i tools cambiano, le richieste all'LLM non combaciano più con le
+# fixture (replay miss): vanno registrate di nuovo.
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import sys
+import time
+
+from agent_common.instrumentation import AgentTracer
+from agent_common.replay import Replay
+
+FIXTURES = "fixtures/replay.json"
+
+# Tolleranza sul p95 rispetto alla baseline prima di segnalare una regressione
+P95_TOLERANCE = 0.2
+
+
+def p95(values: list) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def run_question(agent, question: str, replay: Replay, repeat: int, reset=None) -> dict:
+    """Esegue la domanda `repeat` volte; ritorna iterazioni, tool call e tempi.
+
+    reset (opzionale): chiamata prima di ogni ripetizione (es. svuotare la cache dei tools)
+    """
+    walls = []
+    summary = {}
+    misses = len(replay.misses)
+    for _ in range(repeat):
+        replay.rewind()
+        if reset:
+            reset()
+        if agent.answer_cache:
+            agent.answer_cache.clear()  # Ogni ripetizione rifà davvero il run
+        tracer = AgentTracer()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.ask_agent(question, tracer=tracer)
+        walls.append(time.perf_counter() - t0)
+        summary = tracer.summary()
+    return {
+        "iterations": summary.get("llm_calls", 0),
+        "tool_calls": summary.get("tool_calls", 0),
+        "tools": summary.get("tools", []),
+        "wall_mean": round(sum(walls) / len(walls), 4),
+        "wall_p95": round(p95(walls), 4),
+        "misses": len(replay.misses) - misses
+    }
+
+
+def record(agent, questions: list, path: str):
+    with Replay(path, mode="record"):
+        for question in questions:
+            print(f"⏺️  {question}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                agent.ask_agent(question)
+    print(f"✅ Fixture salvate in {path}")
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Regressioni rispetto alla baseline: più iterazioni, più tool call o p95 oltre tolleranza."""
+    regressions = []
+    for question, result in results.items():
+        before = baseline.get(question)
+        if not before:
+            continue
+        if result["iterations"] > before["iterations"]:
+            regressions.append(f"{question}: iterations {before['iterations']} -> {result['iterations']}")
+        if result["tool_calls"] > before["tool_calls"]:
+            regressions.append(f"{question}: tool calls {before['tool_calls']} -> {result['tool_calls']}")
+        if result["wall_p95"] > before["wall_p95"] * (1 + P95_TOLERANCE):
+            regressions.append(f"{question}: p95 {before['wall_p95']:.2f}s -> {result['wall_p95']:.2f}s")
+    return regressions
+
+
+def run_benchmark(load_agent, questions: list, description: str, llm_latency: float, reset=None):
+    """CLI del benchmark. load_agent: funzione che importa e ritorna il modulo agent del progetto."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--record", action="store_true", help="registra le fixture con chiamate reali")
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=llm_latency, help="secondi per chiamata LLM")
+    parser.add_argument("--http-latency", type=float, default=0.1, help="secondi per chiamata API")
+    parser.add_argument("--save", help="salva i risultati (JSON) per usarli come baseline")
+    parser.add_argument("--baseline", help="confronta con risultati salvati in precedenza")
+    args = parser.parse_args()
+
+    # Avvio dell'agente (import, client, warm-up) fuori da registrazione e replay
+    agent = load_agent()
+    if args.record:
+        record(agent, questions, args.fixtures)
+        return
+
+    replay = Replay(args.fixtures, llm_latency=args.llm_latency, http_latency=args.http_latency)
+    results = {}
+    print(f"{'Domanda':<50} {'iter':>4} {'tools':>5} {'media':>7} {'p95':>7}")
+    with replay:
+        for question in questions:
+            result = run_question(agent, question, replay, args.repeat, reset)
+            results[question] = result
+            flag = "  ⚠️ replay miss" if result["misses"] else ""
+            print(f"{question[:50]:<50} {result['iterations']:>4} {result['tool_calls']:>5} "
+                  f"{result['wall_mean']:>6.2f}s {result['wall_p95']:>6.2f}s{flag}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(result["misses"] for result in results.values())
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if not regressions:
+            print("✅ Nessuna regressione rispetto alla baseline")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
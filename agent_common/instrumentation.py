@@ -0,0 +1,240 @@
+# File: instrumentation.py
+# Tracing delle latenze dell'agente: span per chiamate LLM, tools, HTTP, cache hit e attese di rate limit
+#
+# Agente OpenAI: AgentTracer come callback di AgentExecutor (span LLM e tools dai callback).
+# Agente Ollama (ReAct): AgentTracer come callback dei tools; le chiamate a Ollama con record_event.
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Log JSON (una riga per span); se AGENT_TRACE_FILE non è impostato i log vanno solo al logger
+TRACE_FILE = os.getenv("AGENT_TRACE_FILE")
+logger = logging.getLogger("agent.trace")
+if TRACE_FILE:
+    _handler = logging.FileHandler(TRACE_FILE, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Istogramma cumulativo delle durate (thread-safe)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "count": self.count,
+                "sum": round(self.total, 4),
+                "max": round(self.max, 4),
+                "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+            }
+
+
+# Istogrammi aggregati di processo, per "kind:name" (es. "tool:get_weather", "llm:gpt-4o-mini")
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+def observe(kind: str, name: str, duration: float):
+    key = f"{kind}:{name}"
+    with _histograms_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram()
+    _histograms[key].observe(duration)
+
+def histograms() -> dict:
+    return {key: histogram.snapshot() for key, histogram in sorted(_histograms.items())}
+
+
+# Tracer della richiesta corrente: cache e rate limiter ci registrano i loro eventi
+current_tracer = contextvars.ContextVar("current_tracer", default=None)
+
+def record_event(kind: str, name: str, duration: float = 0.0, **attrs):
+    """Registra uno span puntuale (cache hit, attesa di throttling, richiesta HTTP)."""
+    observe(kind, name, duration)
+    tracer = current_tracer.get()
+    if tracer is not None:
+        tracer.add_span(kind, name, time.time() - duration, duration, **attrs)
+
+
+# Convenzione dei tools: un fallimento si riporta come testo che inizia con TOOL_ERROR_PREFIX
+# ("Error getting weather: ...", "Error: ... timed out"), così il modello lo legge e può riprovare;
+# il tracer marca lo span come errore e la risposta non finisce nella cache semantica
+TOOL_ERROR_PREFIX = "Error"
+
+def tool_error(message: str) -> str:
+    return f"{TOOL_ERROR_PREFIX}: {message}"
+
+def is_tool_error(output) -> bool:
+    return str(getattr(output, "content", output)).lstrip().startswith(TOOL_ERROR_PREFIX)
+
+
+def _token_usage(response) -> dict:
+    """Token di prompt/completion da una LLMResult (OpenAI e Ollama)."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"input": usage.get("input_tokens", 0), "output": usage.get("output_tokens", 0)}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return {"input": usage.get("prompt_tokens", 0), "output": usage.get("completion_tokens", 0)}
+
+
+class AgentTracer(BaseCallbackHandler):
+    """Callback LangChain che registra uno span per ogni chiamata LLM e tool di un run dell'agente.
+
+    Uso:
+        tracer = AgentTracer()
+        with tracer.activate():
+            agent_executor.invoke(inputs, config={"callbacks": [tracer]})
+        tracer.summary()
+    """
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self._open = {}  # run_id -> span in corso
+        self.lock = threading.Lock()
+
+    # --- Span ---
+
+    def add_span(self, kind: str, name: str, start: float, duration: float, **attrs):
+        span = {
+            "trace_id": self.trace_id,
+            "kind": kind,
+            "name": name,
+            "start": round(start, 4),
+            "duration": round(duration, 4),
+            **attrs
+        }
+        with self.lock:
+            self.spans.append(span)
+        logger.info(json.dumps(span, default=str))
+
+    def _start(self, run_id, kind: str, name: str, parent_run_id=None):
+        with self.lock:
+            self._open[run_id] = {
+                "kind": kind,
+                "name": name,
+                "t0": time.perf_counter(),
+                "start": time.time(),
+                "run_id": str(run_id),
+                "parent_id": str(parent_run_id) if parent_run_id else None
+            }
+
+    def _end(self, run_id, **attrs):
+        with self.lock:
+            span = self._open.pop(run_id, None)
+        if span is None:
+            return
+        duration = time.perf_counter() - span.pop("t0")
+        observe(span["kind"], span["name"], duration)
+        self.add_span(span.pop("kind"), span.pop("name"), span.pop("start"), duration, **span, **attrs)
+
+    @contextmanager
+    def activate(self, name: str = "agent"):
+        """Rende il tracer quello corrente e registra lo span radice del run."""
+        token = current_tracer.set(self)
+        t0 = time.perf_counter()
+        start = time.time()
+        try:
+            yield self
+        finally:
+            current_tracer.reset(token)
+            duration = time.perf_counter() - t0
+            observe("agent", name, duration)
+            self.add_span("agent", name, start, duration, summary=self.summary())
+
+    # --- Callback LangChain ---
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", _model_name(serialized, kwargs), parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", _model_name(serialized, kwargs), parent_run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self.lock:
+            span = self._open.get(run_id)
+            if span is not None and "ttft" not in span:
+                span["ttft"] = round(time.perf_counter() - span["t0"], 4)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, tokens=_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name", "tool"), parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        # I tools riportano i fallimenti come testo (vedi TOOL_ERROR_PREFIX)
+        self._end(run_id, **({"error": "tool reported an error"} if is_tool_error(output) else {}))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        record_event("retry", str(run_id), attempt=getattr(retry_state, "attempt_number", None))
+
+    # --- Aggregati ---
+
+    def summary(self) -> dict:
+        """Totali del run: chiamate e tempo per tipo, token LLM, tool usati."""
+        with self.lock:
+            spans = list(self.spans)
+        result = {"llm_calls": 0, "llm_seconds": 0.0, "input_tokens": 0, "output_tokens": 0,
+                  "tool_calls": 0, "tool_seconds": 0.0, "tools": [],
+                  "cache_hits": 0, "throttle_seconds": 0.0, "http_requests": 0}
+        for span in spans:
+            if span["kind"] == "llm":
+                result["llm_calls"] += 1
+                result["llm_seconds"] += span["duration"]
+                result["input_tokens"] += span.get("tokens", {}).get("input", 0)
+                result["output_tokens"] += span.get("tokens", {}).get("output", 0)
+            elif span["kind"] == "tool":
+                result["tool_calls"] += 1
+                result["tool_seconds"] += span["duration"]
+                result["tools"].append(span["name"])
+            elif span["kind"] == "cache_hit":
+                result["cache_hits"] += 1
+            elif span["kind"] == "throttle":
+                result["throttle_seconds"] += span["duration"]
+            elif span["kind"] == "http":
+                result["http_requests"] += 1
+        for key in ("llm_seconds", "tool_seconds", "throttle_seconds"):
+            result[key] = round(result[key], 4)
+        return result
+
+
+def _model_name(serialized, kwargs) -> str:
+    params = kwargs.get("invocation_params") or {}
+    return params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "llm"
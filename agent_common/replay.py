@@ -0,0 +1,208 @@
+# File: replay.py
+# Record/replay del traffico HTTP dell'agente (LLM + API dei tools) su fixture JSON
+#
+# Registrazione:  with Replay("fixtures/replay.json", mode="record"): ask_agent(...)
+# Replay offline: with Replay("fixtures/replay.json", llm_latency=0.8, http_latency=0.1): ask_agent(...)
+#
+# Si intercetta il trasporto (requests e httpx), quindi funziona sia per le chiamate
+# dei tools sia per i client LLM (openai e ollama usano httpx), senza toccare il codice.
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_LLM_HOSTS = ("api.openai.com", "localhost:11434", "127.0.0.1:11434")
+
+
+def request_key(method: str, url: str, body) -> str:
+    """Chiave stabile di una richiesta: metodo, URL con query ordinata e hash del body."""
+    parts = urlsplit(str(url))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}"
+    if query:
+        key += f"?{query}"
+    if body:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key += f" #{hashlib.sha256(body).hexdigest()[:16]}"
+    return key
+
+
+class Replay:
+    """Registra o riproduce le risposte HTTP; più risposte per la stessa chiave in ordine FIFO."""
+
+    def __init__(self, path: str, mode: str = "replay", llm_latency: float = 0.0,
+                 http_latency: float = 0.0, llm_hosts=DEFAULT_LLM_HOSTS):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.llm_latency = llm_latency
+        self.http_latency = http_latency
+        self.llm_hosts = set(llm_hosts)
+        self.lock = threading.Lock()
+        self.fixtures = {}
+        self.cursors = {}
+        self.misses = []
+        self._originals = None
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                self.fixtures = json.load(f)
+
+    # --- Fixture ---
+
+    def rewind(self):
+        """Riparte dalla prima risposta di ogni chiave (es. tra due ripetizioni del benchmark)."""
+        with self.lock:
+            self.cursors = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.fixtures, f, indent=1, ensure_ascii=False)
+
+    def _store(self, key: str, status: int, content_type: str, content: bytes) -> dict:
+        fixture = {
+            "status": status,
+            "content_type": content_type,
+            "body": content.decode("utf-8", errors="replace")
+        }
+        with self.lock:
+            self.fixtures.setdefault(key, []).append(fixture)
+        return fixture
+
+    def _store_error(self, key: str, error: Exception):
+        # Anche timeout ed errori di rete fanno parte del comportamento da riprodurre
+        with self.lock:
+            self.fixtures.setdefault(key, []).append({"error": str(error)})
+
+    def _lookup(self, key: str):
+        """Prossima risposta registrata per la chiave (l'ultima si ripete); None se manca."""
+        with self.lock:
+            responses = self.fixtures.get(key)
+            if not responses:
+                self.misses.append(key)
+                return None
+            index = self.cursors.get(key, 0)
+            self.cursors[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+    def _latency(self, url) -> float:
+        return self.llm_latency if urlsplit(str(url)).netloc in self.llm_hosts else self.http_latency
+
+    @staticmethod
+    def _miss_body(key: str) -> dict:
+        # 404 e non un'eccezione: i client LLM non ritentano e i tools riportano l'errore
+        return {"status": 404, "content_type": "application/json",
+                "body": json.dumps({"error": f"replay miss: {key}"})}
+
+    # --- Trasporti ---
+
+    def _requests_send(self, original):
+        replay = self
+
+        def send(adapter, request, **kwargs):
+            key = request_key(request.method, request.url, request.body)
+            if replay.mode == "record":
+                try:
+                    response = original(adapter, request, **kwargs)
+                except requests.RequestException as e:
+                    replay._store_error(key, e)
+                    raise
+                replay._store(key, response.status_code, response.headers.get("Content-Type", ""),
+                              response.content)
+                return response
+
+            time.sleep(replay._latency(request.url))
+            fixture = replay._lookup(key) or replay._miss_body(key)
+            if "error" in fixture:
+                raise requests.ConnectionError(fixture["error"], request=request)
+            response = requests.Response()
+            response.status_code = fixture["status"]
+            response.headers["Content-Type"] = fixture["content_type"]
+            response._content = fixture["body"].encode("utf-8")
+            response.encoding = "utf-8"
+            response.url = request.url
+            response.request = request
+            return response
+
+        return send
+
+    def _httpx_response(self, request: httpx.Request, fixture: dict) -> httpx.Response:
+        if "error" in fixture:
+            raise httpx.ConnectError(fixture["error"], request=request)
+        return httpx.Response(
+            fixture["status"],
+            headers={"Content-Type": fixture["content_type"]},
+            content=fixture["body"].encode("utf-8"),
+            request=request
+        )
+
+    def _httpx_handle(self, original):
+        replay = self
+
+        def handle_request(transport, request):
+            key = request_key(request.method, request.url, request.read())
+            if replay.mode == "record":
+                try:
+                    response = original(transport, request)
+                except httpx.TransportError as e:
+                    replay._store_error(key, e)
+                    raise
+                content = response.read()
+                fixture = replay._store(key, response.status_code, response.headers.get("Content-Type", ""),
+                                        content)
+                return replay._httpx_response(request, fixture)
+
+            time.sleep(replay._latency(request.url))
+            return replay._httpx_response(request, replay._lookup(key) or replay._miss_body(key))
+
+        return handle_request
+
+    def _httpx_ahandle(self, original):
+        replay = self
+
+        async def handle_async_request(transport, request):
+            key = request_key(request.method, request.url, await request.aread())
+            if replay.mode == "record":
+                try:
+                    response = await original(transport, request)
+                except httpx.TransportError as e:
+                    replay._store_error(key, e)
+                    raise
+                content = await response.aread()
+                fixture = replay._store(key, response.status_code, response.headers.get("Content-Type", ""),
+                                        content)
+                return replay._httpx_response(request, fixture)
+
+            await asyncio.sleep(replay._latency(request.url))
+            return replay._httpx_response(request, replay._lookup(key) or replay._miss_body(key))
+
+        return handle_async_request
+
+    def __enter__(self):
+        self._originals = (
+            HTTPAdapter.send,
+            httpx.HTTPTransport.handle_request,
+            httpx.AsyncHTTPTransport.handle_async_request
+        )
+        HTTPAdapter.send = self._requests_send(self._originals[0])
+        httpx.HTTPTransport.handle_request = self._httpx_handle(self._originals[1])
+        httpx.AsyncHTTPTransport.handle_async_request = self._httpx_ahandle(self._originals[2])
+        return self
+
+    def __exit__(self, *exc):
+        (HTTPAdapter.send,
+         httpx.HTTPTransport.handle_request,
+         httpx.AsyncHTTPTransport.handle_async_request) = self._originals
+        if self.mode == "record":
+            self.save()
+        return False
@@ -0,0 +1,227 @@
+# File: semantic_cache.py
+# Cache delle risposte dell'agente per domande con lo stesso significato
+# ("meteo a Milano" / "che tempo fa a Milano"), con TTL legato ai tools usati
+#
+# Lingua: l'agente risponde nella lingua dell'utente, quindi una risposta si riusa solo per
+# domande nella stessa lingua ("what's the weather in Milan" non riceve la risposta in italiano).
+#
+# Soglia di similarità: la scala del coseno cambia molto da un modello di embedding all'altro
+# (una parafrasi può valere 0.7 con uno e 0.9 con un altro), quindi una costante fissa o non
+# trova le parafrasi o confonde "meteo a Milano" con "meteo a Roma". Di default la soglia viene
+# calibrata con il modello in uso su CALIBRATION_PAIRS (calibrate, da chiamare all'avvio): a metà
+# tra la coppia di domande diverse più simile e la coppia equivalente meno simile. Se le due
+# classi si sovrappongono vince la sicurezza (niente risposte sbagliate, qualche hit in meno).
+# Finché la soglia non è calibrata valgono solo le domande identiche.
+# SEMANTIC_CACHE_THRESHOLD=0.9 fissa la soglia e salta la calibrazione.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ENABLED = os.getenv("SEMANTIC_CACHE", "1") == "1"
+# Similarità coseno minima; non impostata = calibrata sul modello di embedding (vedi sopra)
+THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD")) if os.getenv("SEMANTIC_CACHE_THRESHOLD") else None
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+
+# Durata di una risposta in base ai tools che l'hanno prodotta (vale il più "fresco")
+TOOL_TTLS = {
+    "get_weather": 10 * 60,
+    "get_weather_by_place": 10 * 60,
+    "get_weather_for_places": 10 * 60,
+    "get_forecast": 30 * 60,
+    "get_forecast_by_place": 30 * 60,
+    "convert_currency": 3600,
+    "get_country_info": 7 * 24 * 3600,
+    "search_location": 30 * 24 * 3600,
+}
+UNKNOWN_TOOL_TTL = 10 * 60
+NO_TOOLS_TTL = 24 * 3600  # Risposte senza tools (conoscenza generale)
+
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+WORD_RE = re.compile(r"[a-zà-ù']+")
+
+# Parole frequenti nelle domande all'agente, per riconoscere la lingua (italiano o inglese)
+LANGUAGE_WORDS = {
+    "it": {"che", "il", "lo", "la", "di", "del", "della", "per", "con", "come", "quanto", "quanti",
+           "quale", "dove", "cosa", "sono", "è", "fa", "tempo", "meteo", "previsioni", "oggi", "domani",
+           "dimmi", "valuta", "sul", "sulla", "nel", "nella", "euro", "dollari", "giorni", "tra", "e"},
+    "en": {"what", "what's", "the", "is", "of", "for", "with", "how", "much", "many", "which", "where",
+           "weather", "forecast", "today", "tomorrow", "tell", "me", "about", "currency", "does", "use",
+           "like", "days", "next", "and", "to", "dollars", "euros", "convert"},
+}
+
+# Coppie per la calibrazione: domande equivalenti (nella stessa lingua) che devono colpire la
+# cache e domande con lo stesso schema ma luogo o richiesta diversi, che non devono colpirla
+CALIBRATION_PAIRS = {
+    "same": [
+        ("meteo a Milano", "che tempo fa a Milano?"),
+        ("what's the weather in Milan", "how's the weather in Milan?"),
+        ("previsioni del tempo per Parigi", "previsioni meteo Parigi"),
+        ("tell me about Japan", "what can you tell me about Japan?"),
+        ("what currency does Brazil use?", "which currency is used in Brazil?"),
+        ("che tempo fa a Londra?", "meteo Londra"),
+    ],
+    "different": [
+        ("meteo a Milano", "meteo a Roma"),
+        ("what's the weather in Milan", "what's the weather in Rome"),
+        ("tell me about Japan", "tell me about China"),
+        ("what currency does Brazil use?", "what currency does Argentina use?"),
+        ("weather forecast for Paris", "current weather in Paris"),
+        ("che tempo fa a Londra?", "che tempo fa a Dublino?"),
+    ],
+}
+CALIBRATION_MARGIN = 0.02  # Sopra la coppia diversa più simile, se le classi si sovrappongono
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def answer_ttl(tools: list) -> float:
+    if not tools:
+        return NO_TOOLS_TTL
+    return min(TOOL_TTLS.get(tool, UNKNOWN_TOOL_TTL) for tool in tools)
+
+
+def normalize(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def detect_language(question: str):
+    """"it", "en" o None (nessuna parola riconosciuta o parità)."""
+    words = WORD_RE.findall(question.lower())
+    counts = {language: sum(word in vocabulary for word in words) for language, vocabulary in LANGUAGE_WORDS.items()}
+    best = max(counts, key=counts.get)
+    if counts[best] == 0 or list(counts.values()).count(counts[best]) > 1:
+        return None
+    return best
+
+
+class SemanticCache:
+    """Indice vettoriale in memoria (embedding normalizzati) con TTL per voce ed eviction LRU.
+
+    embed: funzione testo -> vettore (embedding del provider del progetto)
+    embed_many (opzionale): funzione lista di testi -> vettori, per calibrare con una sola chiamata
+    threshold: similarità minima; None = solo domande identiche finché non si chiama calibrate()
+    """
+
+    def __init__(self, embed, threshold: float = THRESHOLD, max_entries: int = MAX_ENTRIES, embed_many=None):
+        self.embed = embed
+        self.embed_many = embed_many
+        self.threshold = threshold
+        self.calibration = None
+        self.calibration_lock = threading.Lock()
+        self.max_entries = max_entries
+        self.vectors = None                # matrice (max_entries, dim), allocata al primo inserimento
+        self.entries = OrderedDict()       # slot -> {"question", "answer", "numbers", "language", "expires_at"}; ordine LRU
+        self.exact = {}                    # domanda normalizzata -> slot (niente embedding se identica)
+        self.free = list(range(max_entries))
+        self.lock = threading.Lock()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def _vector(self, question: str):
+        return _unit(self.embed(normalize(question)))
+
+    def calibrate(self, pairs: dict = CALIBRATION_PAIRS) -> dict:
+        """Calcola la soglia con il modello di embedding in uso e la imposta; ritorna le similarità."""
+        with self.calibration_lock:
+            texts = sorted({normalize(text) for group in pairs.values() for pair in group for text in pair})
+            raw = self.embed_many(texts) if self.embed_many else [self.embed(text) for text in texts]
+            vectors = {text: _unit(vector) for text, vector in zip(texts, raw)}
+            scores = {group: [float(vectors[normalize(a)] @ vectors[normalize(b)]) for a, b in pairs[group]]
+                      for group in ("same", "different")}
+            same_min, different_max = min(scores["same"]), max(scores["different"])
+            if same_min > different_max:
+                threshold = (same_min + different_max) / 2
+            else:
+                threshold = different_max + CALIBRATION_MARGIN
+            self.threshold = round(min(threshold, 1.0), 4)
+            self.calibration = {"threshold": self.threshold, "same_min": round(same_min, 4),
+                                "different_max": round(different_max, 4), "separable": same_min > different_max}
+            print(f"🎯 Semantic cache threshold {self.threshold} (equivalent >= {same_min:.3f}, "
+                  f"different <= {different_max:.3f})")
+            if not self.calibration["separable"]:
+                print("⚠️ The embedding model does not separate paraphrases from different places: "
+                      "some equivalent questions will miss the cache")
+            return self.calibration
+
+    def get(self, question: str):
+        """Ritorna (risposta o None, embedding della domanda da riusare in put)."""
+        key = normalize(question)
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            slot = self.exact.get(key)
+            if slot is not None:
+                self.entries.move_to_end(slot)
+                self.hits["exact"] += 1
+                return self.entries[slot]["answer"], None
+
+        vector = self._vector(question)
+        numbers = sorted(NUMBER_RE.findall(key))
+        language = detect_language(key)
+        with self.lock:
+            # Soglia non ancora calibrata (avvio senza warm-up o embedding non raggiungibile): niente match semantici
+            if self.entries and self.threshold is not None:
+                slots = list(self.entries)
+                scores = self.vectors[slots] @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    entry = self.entries[slots[i]]
+                    # Importi e date diversi ("100 USD" / "200 USD") non sono la stessa domanda,
+                    # e la risposta deve essere nella lingua della domanda
+                    if entry["numbers"] == numbers and entry["language"] == language:
+                        self.entries.move_to_end(slots[i])
+                        self.hits["semantic"] += 1
+                        return entry["answer"], vector
+            self.misses += 1
+        return None, vector
+
+    def put(self, question: str, answer: str, ttl: float, vector=None):
+        if vector is None:
+            vector = self._vector(question)
+        key = normalize(question)
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if key in self.exact:
+                self._remove(self.exact[key])
+            if not self.free:
+                self._remove(next(iter(self.entries)))  # Meno usata di recente
+            slot = self.free.pop()
+            self.vectors[slot] = vector
+            self.entries[slot] = {
+                "question": key,
+                "answer": answer,
+                "numbers": sorted(NUMBER_RE.findall(key)),
+                "language": detect_language(key),
+                "expires_at": time.time() + ttl
+            }
+            self.exact[key] = slot
+
+    def _remove(self, slot: int):
+        entry = self.entries.pop(slot)
+        self.exact.pop(entry["question"], None)
+        self.free.append(slot)
+
+    def _expire(self, now: float):
+        for slot in [slot for slot, entry in self.entries.items() if entry["expires_at"] <= now]:
+            self._remove(slot)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": dict(self.hits), "misses": self.misses,
+                    "threshold": self.threshold}
+
+    def clear(self):
+        with self.lock:
+            for slot in list(self.entries):
+                self._remove(slot)
@@ -0,0 +1,225 @@
+# File: batching.py
+# Coda di batching asincrona per un modello: caricamento lazy, limite di batch in
+# esecuzione, scaricamento dopo un periodo di inattività e metriche Prometheus
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LatencyHistogram:
+    """Istogramma cumulativo in formato Prometheus (thread-safe), con etichetta del modello."""
+
+    def __init__(self, name, help_text, model, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.name = name
+        self.help_text = help_text
+        self.model = model
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def render(self, header=True):
+        label = f'model="{self.model}"'
+        with self.lock:
+            lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"] if header else []
+            for bound, count in zip(self.buckets, self.counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum{{{label}}} {self.total}")
+            lines.append(f"{self.name}_count{{{label}}} {self.count}")
+        return "\n".join(lines)
+
+
+class Overloaded(Exception):
+    """La coda del modello è piena: il chiamante deve riprovare più tardi."""
+
+
+class ModelWorker:
+    """Un modello dietro una coda limitata che raggruppa le richieste concorrenti in batch.
+
+    loader: funzione bloccante che carica il modello e ritorna predict(texts) -> lista di risultati
+    cleanup: funzione opzionale chiamata dopo lo scaricamento (es. liberare memoria del framework)
+    """
+
+    def __init__(self, name, loader, cleanup=None, max_batch_size=32, max_wait_ms=10,
+                 max_concurrency=1, max_queue=256, idle_unload=600):
+        self.name = name
+        self.loader = loader
+        self.cleanup = cleanup
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.idle_unload = idle_unload  # Secondi senza richieste prima di scaricare (0 = mai)
+        # Thread dedicati al modello: il forward pass non blocca l'event loop né gli altri modelli
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+
+        self.predict = None
+        self.queue = None        # Creati al primo uso, dentro l'event loop del server
+        self.slots = None
+        self.load_lock = None
+        self.task = None
+        self.in_flight = 0       # Batch accettati e non ancora finiti
+        self.collecting = 0      # Richieste già tolte dalla coda ma non ancora in un batch avviato
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.unloads = 0
+        self.rejected = 0
+
+        self.request_latency = LatencyHistogram("gateway_request_seconds", "Latenza di una richiesta al modello", name)
+        self.queue_wait = LatencyHistogram("gateway_queue_wait_seconds", "Attesa in coda prima del batch", name)
+        self.batch_latency = LatencyHistogram("gateway_batch_seconds", "Durata di un batch", name)
+        self.batch_size = LatencyHistogram("gateway_batch_size", "Testi per batch", name,
+                                           buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.load_latency = LatencyHistogram("gateway_load_seconds", "Durata del caricamento del modello", name,
+                                             buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+    @property
+    def loaded(self) -> bool:
+        return self.predict is not None
+
+    def _ensure_started(self):
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.slots = asyncio.Semaphore(self.max_concurrency)
+            self.load_lock = asyncio.Lock()
+            self.task = asyncio.create_task(self._loop())
+
+    async def submit(self, texts: list) -> list:
+        """Accoda i testi e attende i risultati (stesso ordine); solleva Overloaded se la coda è piena."""
+        self._ensure_started()
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((texts, future, start))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded(f"Model '{self.name}' is overloaded, retry later")
+        results = await future
+        self.request_latency.observe(time.perf_counter() - start)
+        return results
+
+    async def preload(self):
+        """Carica il modello subito (es. all'avvio) invece che alla prima richiesta."""
+        self._ensure_started()
+        await self._ensure_loaded()
+
+    async def _collect(self):
+        """Attende la prima richiesta, poi raccoglie le altre fino a batch pieno o timeout."""
+        items = [await self.queue.get()]
+        # Contate subito (prima di altri await): per unload_if_idle il modello serve ancora
+        self.collecting += 1
+        size = len(items[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            self.collecting += 1
+            size += len(item[0])
+        return items
+
+    async def _loop(self):
+        while True:
+            items = await self._collect()
+            # Al massimo max_concurrency batch in esecuzione: gli altri restano in coda
+            await self.slots.acquire()
+            self.collecting -= len(items)
+            self.in_flight += 1
+            asyncio.create_task(self._run_batch(items))
+
+    async def _ensure_loaded(self):
+        async with self.load_lock:
+            if self.predict is None:
+                start = time.perf_counter()
+                print(f"⏳ Loading model '{self.name}'...")
+                self.predict = await asyncio.get_running_loop().run_in_executor(self.executor, self.loader)
+                self.load_latency.observe(time.perf_counter() - start)
+                self.loads += 1
+                print(f"✅ Model '{self.name}' loaded in {time.perf_counter() - start:.1f}s")
+            return self.predict
+
+    async def _run_batch(self, items):
+        # Le richieste annullate (client disconnesso) non occupano posto nel batch
+        items = [item for item in items if not item[1].done()]
+        try:
+            if not items:
+                return
+            predict = await self._ensure_loaded()
+            start = time.perf_counter()
+            for _, _, enqueued_at in items:
+                self.queue_wait.observe(start - enqueued_at)
+            texts = [text for item_texts, _, _ in items for text in item_texts]
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, predict, texts)
+            self.batch_latency.observe(time.perf_counter() - start)
+            self.batch_size.observe(len(texts))
+
+            # Ridistribuisci i risultati alle richieste originali
+            offset = 0
+            for item_texts, future, _ in items:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+            self.slots.release()
+
+    def _busy(self) -> bool:
+        """Richieste in coda, in raccolta per il prossimo batch o batch in esecuzione."""
+        return bool(self.in_flight or self.collecting or not self.queue.empty())
+
+    async def unload_if_idle(self):
+        """Scarica il modello se nessuno lo usa da idle_unload secondi; al prossimo uso si ricarica."""
+        if not self.loaded or not self.idle_unload or self.task is None:
+            return
+        if self._busy() or time.monotonic() - self.last_used < self.idle_unload:
+            return
+        async with self.load_lock:
+            if self._busy():
+                return
+            self.predict = None
+            if self.cleanup:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.cleanup)
+            self.unloads += 1
+            print(f"💤 Model '{self.name}' unloaded after {self.idle_unload}s idle")
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "queue": self.queue.qsize() if self.queue else 0,
+            "in_flight": self.in_flight,
+            "collecting": self.collecting,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "rejected": self.rejected
+        }
+
+    def histograms(self) -> list:
+        return [self.request_latency, self.queue_wait, self.batch_latency, self.batch_size, self.load_latency]
@@ -0,0 +1,101 @@
+# File: models.py
+# Caricamento dei tre modelli del gateway: ognuno ritorna predict(texts) -> risultati
+# nello stesso ordine; gli import pesanti avvengono solo al primo caricamento
+
+import gc
+import os
+import pickle
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+INTENT_MODEL_DIR = os.getenv("INTENT_MODEL_DIR", os.path.join(HERE, "..", "tensorFlowProject", "intent_model"))
+INTENT_MAX_LEN = 20  # Deve essere lo stesso di tensorFlowProject/train.py
+
+PYTORCH_DIR = os.path.join(HERE, "..", "PyTorch")  # sentiment_backend.py: backend e padding dinamico condivisi
+SENTIMENT_MODEL_DIR = os.getenv("SENTIMENT_MODEL_DIR", os.path.join(PYTORCH_DIR, "sentiment-model"))
+# "torch", "onnx" o "onnx-int8" (modelli in SENTIMENT_MODEL_DIR/onnx, vedi PyTorch/export_onnx.py)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch")
+SENTIMENT_MAX_LENGTH = 512
+SENTIMENT_BATCH_SIZE = 32  # Testi per forward pass (i batch del gateway possono essere più grandi)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+# --- Intent (TensorFlow) ---
+
+def load_intent():
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+    model = tf.keras.models.load_model(os.path.join(INTENT_MODEL_DIR, "model.keras"))
+    with open(os.path.join(INTENT_MODEL_DIR, "tokenizer.pkl"), "rb") as f:
+        tokenizer = pickle.load(f)
+    with open(os.path.join(INTENT_MODEL_DIR, "label_encoder.pkl"), "rb") as f:
+        label_encoder = pickle.load(f)
+
+    def predict(texts):
+        padded = pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=INTENT_MAX_LEN, padding="post")
+        # Chiamata diretta al modello: per batch piccoli è molto più veloce di model.predict
+        probabilities = model(padded, training=False).numpy()
+        classes = np.argmax(probabilities, axis=1)
+        intents = label_encoder.inverse_transform(classes)
+        return [{"intent": str(intent), "confidence": float(probabilities[row, cls])}
+                for row, (intent, cls) in enumerate(zip(intents, classes))]
+    return predict
+
+
+def unload_intent():
+    import tensorflow as tf
+    tf.keras.backend.clear_session()
+    gc.collect()
+
+
+# --- Sentiment (PyTorch, DistilBERT) ---
+
+def load_sentiment():
+    import torch
+    from transformers import DistilBertTokenizerFast
+
+    if PYTORCH_DIR not in sys.path:
+        sys.path.append(PYTORCH_DIR)
+    from sentiment_backend import LABELS, load_backend, forward_buckets
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(SENTIMENT_MODEL_DIR)
+    run = load_backend(SENTIMENT_BACKEND, SENTIMENT_MODEL_DIR)
+    print(f"🧠 Sentiment backend: {SENTIMENT_BACKEND}")
+
+    def predict(texts):
+        input_ids = tokenizer(list(texts), truncation=True, max_length=SENTIMENT_MAX_LENGTH)["input_ids"]
+        # Bucket per lunghezza con padding dinamico, come PyTorch/inference.py
+        logits = forward_buckets(run, input_ids, tokenizer.pad_token_id, SENTIMENT_BATCH_SIZE)
+        confidences, predictions = torch.softmax(logits, dim=-1).max(dim=-1)
+        return [{"sentiment": LABELS[p], "confidence": c}
+                for p, c in zip(predictions.tolist(), confidences.tolist())]
+    return predict
+
+
+def unload_sentiment():
+    gc.collect()
+
+
+# --- Embedding (OpenAI) ---
+
+def load_embedding():
+    from openai import OpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY non trovata: serve per il modello di embedding")
+    client = OpenAI(api_key=api_key)
+
+    def predict(texts):
+        # Un'unica chiamata per tutto il batch invece di una per testo
+        response = client.embeddings.create(input=list(texts), model=EMBEDDING_MODEL)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return predict
+
+
+def unload_embedding():
+    gc.collect()
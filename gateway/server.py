@@ -0,0 +1,180 @@
+# File: server.py
+# Gateway di inferenza: intent (TensorFlow), sentiment (DistilBERT) ed embedding (OpenAI)
+# dietro un'unica API async, con una coda di batching per modello
+#
+# Avvio: uvicorn server:app --port 8080   (un solo worker: i modelli vivono nel processo)
+# - POST /v1/intent       {"text": "..."} o {"texts": [...]}
+# - POST /v1/sentiment    idem
+# - POST /v1/embeddings   idem
+# - POST /v1/enrich       {"text": ...} o {"texts": [...]}, opzionale "models": ["intent", ...]
+#                         -> intent, sentiment ed embedding di ogni testo in una sola richiesta
+# - GET  /health          stato dei modelli (caricato, coda, batch in corso)
+# - GET  /metrics         metriche Prometheus condivise (etichetta model)
+#
+# Ogni modello si configura con variabili <MODELLO>_*, es. SENTIMENT_MAX_BATCH_SIZE=64:
+# MAX_BATCH_SIZE, MAX_WAIT_MS, CONCURRENCY, MAX_QUEUE, IDLE_UNLOAD (secondi, 0 = mai)
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+load_dotenv()
+
+import models  # noqa: E402 - dopo load_dotenv (OPENAI_API_KEY, percorsi dei modelli)
+from batching import ModelWorker, Overloaded  # noqa: E402
+
+MAX_TEXTS_PER_REQUEST = int(os.getenv("MAX_TEXTS_PER_REQUEST", "256"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))     # Include un eventuale caricamento lazy
+IDLE_CHECK_INTERVAL = 30
+PRELOAD = [name for name in os.getenv("GATEWAY_PRELOAD", "").split(",") if name]
+
+
+def _setting(model: str, key: str, default):
+    return type(default)(os.getenv(f"{model.upper()}_{key}", default))
+
+
+def _worker(name: str, loader, cleanup, max_batch_size: int, max_wait_ms: float, concurrency: int) -> ModelWorker:
+    return ModelWorker(
+        name, loader, cleanup,
+        max_batch_size=_setting(name, "MAX_BATCH_SIZE", max_batch_size),
+        max_wait_ms=_setting(name, "MAX_WAIT_MS", max_wait_ms),
+        max_concurrency=_setting(name, "CONCURRENCY", concurrency),
+        max_queue=_setting(name, "MAX_QUEUE", 256),
+        idle_unload=_setting(name, "IDLE_UNLOAD", 600)
+    )
+
+
+# Modelli locali: un batch alla volta (usano già tutti i core); embedding remoto: più chiamate in parallelo
+workers = {
+    "intent": _worker("intent", models.load_intent, models.unload_intent, 64, 5.0, 1),
+    "sentiment": _worker("sentiment", models.load_sentiment, models.unload_sentiment, 32, 10.0, 1),
+    "embedding": _worker("embedding", models.load_embedding, models.unload_embedding, 128, 20.0, 4),
+}
+
+
+async def unload_idle_models():
+    while True:
+        await asyncio.sleep(IDLE_CHECK_INTERVAL)
+        for worker in workers.values():
+            await worker.unload_if_idle()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for name in PRELOAD:
+        await workers[name].preload()
+    reaper = asyncio.create_task(unload_idle_models())
+    yield
+    reaper.cancel()
+    for worker in workers.values():
+        await worker.close()
+
+app = FastAPI(title="Inference Gateway", lifespan=lifespan)
+
+
+class TextsRequest(BaseModel):
+    text: str | None = None
+    texts: list[str] | None = None
+
+
+class EnrichRequest(TextsRequest):
+    models: list[str] | None = None
+
+
+def _texts(request: TextsRequest) -> list:
+    texts = [request.text] if request.text is not None else request.texts or []
+    if not texts:
+        raise HTTPException(status_code=400, detail="Serve 'text' (stringa) o 'texts' (lista di stringhe)")
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        raise HTTPException(status_code=413, detail=f"Massimo {MAX_TEXTS_PER_REQUEST} testi per richiesta")
+    # Un testo vuoto farebbe fallire l'intero micro-batch (es. embeddings), anche per gli altri client
+    empty = [i for i, text in enumerate(texts) if not text.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Testi vuoti non ammessi (indici: {empty[:10]})")
+    return texts
+
+
+async def _run(name: str, texts: list) -> list:
+    try:
+        return await asyncio.wait_for(workers[name].submit(texts), REQUEST_TIMEOUT)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail=f"Timeout del modello '{name}'")
+
+
+async def _predict(name: str, request: TextsRequest):
+    results = await _run(name, _texts(request))
+    return results[0] if request.text is not None else {"results": results}
+
+
+@app.post("/v1/intent")
+async def intent(request: TextsRequest):
+    return await _predict("intent", request)
+
+
+@app.post("/v1/sentiment")
+async def sentiment(request: TextsRequest):
+    return await _predict("sentiment", request)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: TextsRequest):
+    return await _predict("embedding", request)
+
+
+@app.post("/v1/enrich")
+async def enrich(request: EnrichRequest):
+    """Tutti i modelli richiesti in parallelo sugli stessi testi; un modello in errore non blocca gli altri."""
+    texts = _texts(request)
+    names = request.models or list(workers)
+    unknown = [name for name in names if name not in workers]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Modelli sconosciuti: {', '.join(unknown)}")
+
+    outcomes = await asyncio.gather(*(_run(name, texts) for name in names), return_exceptions=True)
+    # Tutti i modelli saturi: meglio un 429 (il client riprova) di una risposta vuota
+    if all(isinstance(outcome, HTTPException) and outcome.status_code == 429 for outcome in outcomes):
+        raise outcomes[0]
+
+    items = [{"text": text} for text in texts]
+    errors = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            errors[name] = outcome.detail if isinstance(outcome, HTTPException) else f"{type(outcome).__name__}: {outcome}"
+            continue
+        for item, result in zip(items, outcome):
+            item[name] = result
+
+    response = items[0] if request.text is not None else {"results": items}
+    if errors:
+        response = {**response, "errors": errors}
+    return response
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "models": {name: worker.stats() for name, worker in workers.items()}}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    lines = []
+    # Un blocco HELP/TYPE per metrica, poi una serie per modello
+    histograms = [worker.histograms() for worker in workers.values()]
+    for family in zip(*histograms):
+        lines.append("\n".join(h.render(header=(i == 0)) for i, h in enumerate(family)))
+    for metric, key in (("gateway_model_loaded", "loaded"), ("gateway_queue_size", "queue"),
+                        ("gateway_in_flight_batches", "in_flight")):
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f'{metric}{{model="{name}"}} {int(worker.stats()[key])}' for name, worker in workers.items())
+    for metric, key in (("gateway_loads_total", "loads"), ("gateway_unloads_total", "unloads"),
+                        ("gateway_rejected_total", "rejected")):
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{model="{name}"}} {worker.stats()[key]}' for name, worker in workers.items())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -3,23 +3,53 @@
 
 import os
 import re
+import sys
+import json
+import time
+import httpx
+import ollama
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
 from dotenv import load_dotenv
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 from tools import ALL_TOOLS
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.instrumentation import AgentTracer, record_event, tool_error  # noqa: E402
+from agent_common.semantic_cache import SemanticCache, answer_ttl, ENABLED as SEMANTIC_CACHE_ENABLED  # noqa: E402
+
 # Carica environment variables
 load_dotenv()
 
 # Configura LLM con Ollama (DeepSeek R1 8B locale)
-llm = ChatOllama(
-    model="deepseek-r1:8b",
-    temperature=0,
-    base_url="http://localhost:11434"
+# Si usa il client Ollama direttamente (/api/generate) per poter riusare il "context"
+# tra un'iterazione ReAct e la successiva: Ollama elabora solo i token nuovi
+MODEL = "deepseek-r1:8b"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Modello piccolo opzionale per le domande semplici (es. "qwen2.5:3b"); non impostato = sempre MODEL
+SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL")
+SIMPLE_MAX_WORDS = int(os.getenv("AGENT_SIMPLE_MAX_WORDS", "12"))
+# Quanto a lungo Ollama tiene il modello (e la sua KV cache) in memoria dopo una richiesta ("-1" = sempre)
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Carica i modelli all'avvio invece che alla prima domanda
+WARMUP = os.getenv("OLLAMA_WARMUP", "1") == "1"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+# Modello di embedding per la cache semantica (multilingue: "meteo a Milano" ~ "weather in Milan")
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "bge-m3")
+# Stop: il modello tende a inventarsi l'Observation dopo l'Action; lì la generazione si ferma
+OPTIONS = {"temperature": 0, "stop": ["Observation:", "Observation ("]}
+# Azioni dello stesso step eseguite in parallelo
+MAX_PARALLEL_TOOLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4"))
+
+# Connessioni keep-alive verso Ollama riusate tra iterazioni e domande
+client = ollama.Client(
+    host=OLLAMA_URL,
+    timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+    limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=300)
 )
 
-print(f"✅ LLM configured: Ollama - deepseek-r1:8b")
+print(f"✅ LLM configured: Ollama - {MODEL}")
+if SMALL_MODEL:
+    print(f"✅ Simple questions routed to: {SMALL_MODEL}")
 print(f"✅ Tools loaded: {len(ALL_TOOLS)}")
 
 # Mappa dei tools per nome
@@ -32,16 +62,26 @@ def get_tools_description():
         desc.append(f"- {tool.name}: {tool.description}")
     return "\n".join(desc)
 
-# System prompt ReAct-style per modelli senza tool calling nativo
+# System prompt ReAct-style per modelli senza tool calling nativo.
+# È il prefisso stabile: identico per ogni domanda e iterazione, così resta nella KV cache
 REACT_PROMPT = """You are a helpful travel assistant AI. You have access to these tools:
 
 {tools_description}
 
 To use a tool, respond with this EXACT format:
 Action: tool_name
-Action Input: {{"param1": "value1", "param2": "value2"}}
+Action Input: {"param1": "value1", "param2": "value2"}
 
-After receiving the tool result, provide your final answer.
+If you need several independent results (e.g. the weather in different cities),
+write all the actions in the same response, one after the other:
+Action: tool_name
+Action Input: {...}
+Action: other_tool_name
+Action Input: {...}
+They run in parallel and you receive all the observations together.
+
+After receiving the tool results, use more tools if you still miss some information,
+otherwise provide your final answer.
 
 If you don't need a tool, just respond directly.
 
@@ -49,79 +89,333 @@ IMPORTANT:
 - Use the EXACT tool names listed above
 - Action Input must be valid JSON
 - For get_weather and get_forecast, you need latitude and longitude (numbers)
-- For search_location, provide a city/place name as query
-
-User question: {input}
+- For search_location, provide a city/place name as query"""
 
-{agent_scratchpad}"""
+# Descrizione dei tools calcolata una volta sola
+SYSTEM_PROMPT = REACT_PROMPT.replace("{tools_description}", get_tools_description())
 
-prompt = ChatPromptTemplate.from_template(REACT_PROMPT)
+QUESTION_PROMPT = "User question: {input}"
 
-# Chain base
-chain = prompt | llm | StrOutputParser()
+# Dopo i tools si inviano solo le osservazioni: il resto è già nel context di Ollama
+OBSERVATION_LINE = "Observation ({action}): {result}"
+OBSERVATION_PROMPT = """{observations}
+Use more tools if you still need information, otherwise provide your final answer."""
 
 print("✅ Agent created and ready!")
 
-def parse_action(response: str):
-    """Estrae Action e Action Input dalla risposta."""
-    action_match = re.search(r'Action:\s*(\w+)', response)
-    input_match = re.search(r'Action Input:\s*(\{.*?\})', response, re.DOTALL)
-    
-    if action_match and input_match:
-        action = action_match.group(1)
+def _models() -> list:
+    return [MODEL] + ([SMALL_MODEL] if SMALL_MODEL else [])
+
+def _tagged(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+def health() -> dict:
+    """Readiness di Ollama: server raggiungibile, modelli installati e già caricati in memoria."""
+    try:
+        installed = {_tagged(m.model) for m in client.list().models}
+        loaded = {_tagged(m.model) for m in client.ps().models}
+    except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+        return {"ready": False, "error": str(e)}
+    models = {model: {"installed": _tagged(model) in installed, "loaded": _tagged(model) in loaded}
+              for model in _models()}
+    return {"ready": all(state["loaded"] for state in models.values()), "models": models}
+
+def warm_up():
+    """Carica i modelli e pre-elabora il system prompt: la prima domanda non paga il cold start."""
+    for model in _models():
+        t0 = time.perf_counter()
         try:
-            import json
-            action_input = json.loads(input_match.group(1))
-            return action, action_input
+            client.generate(
+                model=model,
+                system=SYSTEM_PROMPT,
+                prompt=QUESTION_PROMPT.format(input="hi"),
+                keep_alive=KEEP_ALIVE,
+                options={**OPTIONS, "num_predict": 1}
+            )
+        except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+            print(f"❌ Warm-up {model} failed: {e}")
+            continue
+        print(f"🔥 {model} loaded in {time.perf_counter() - t0:.1f}s")
+    if answer_cache is not None:
+        try:
+            _embed("hi")
+        except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+            print(f"❌ Warm-up {EMBED_MODEL} failed: {e}")
+            return
+        calibrate_answer_cache()
+
+# Cache semantica delle risposte: domande equivalenti non rifanno LLM e tools
+def _embed(text: str) -> list:
+    return client.embed(model=EMBED_MODEL, input=text, keep_alive=KEEP_ALIVE).embeddings[0]
+
+def _embed_many(texts: list) -> list:
+    return client.embed(model=EMBED_MODEL, input=texts, keep_alive=KEEP_ALIVE).embeddings
+
+answer_cache = SemanticCache(_embed, embed_many=_embed_many) if SEMANTIC_CACHE_ENABLED else None
+MAX_ITERATIONS_ANSWER = "Max iterations reached. Please try a simpler question."
+
+def calibrate_answer_cache():
+    """Calibra la soglia della cache semantica all'avvio (non dentro la prima domanda)."""
+    if answer_cache is None or answer_cache.threshold is not None:
+        return
+    try:
+        answer_cache.calibrate()
+    except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+        print(f"⚠️ Semantic cache calibration failed, exact matches only: {e}")
+
+def _cached_answer(question: str):
+    """(risposta in cache o None, embedding della domanda)."""
+    if answer_cache is None:
+        return None, None
+    try:
+        answer, vector = answer_cache.get(question)
+    except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+        print(f"⚠️ Semantic cache unavailable: {e}")
+        return None, None
+    if answer is not None:
+        record_event("cache_hit", "answer")
+    return answer, vector
+
+def _remember_answer(question: str, answer: str, tracer: AgentTracer, vector=None):
+    """Salva la risposta con il TTL del tool più "fresco" usato; mai risposte con errori."""
+    if answer_cache is None or not answer or answer == MAX_ITERATIONS_ANSWER:
+        return
+    if any("error" in span for span in tracer.spans):
+        return
+    try:
+        answer_cache.put(question, answer, answer_ttl(tracer.summary()["tools"]), vector)
+    except (ConnectionError, httpx.HTTPError, ollama.ResponseError) as e:
+        print(f"⚠️ Semantic cache unavailable: {e}")
+
+# Domande che chiedono più cose insieme: meglio il modello grande
+MULTI_STEP_RE = re.compile(r",|;|\b(and|e|compare|confronta|versus|vs|then|poi)\b", re.IGNORECASE)
+
+def choose_model(question: str) -> str:
+    """Domande brevi e a un solo passo vanno al modello piccolo, se configurato."""
+    if SMALL_MODEL and len(question.split()) <= SIMPLE_MAX_WORDS and not MULTI_STEP_RE.search(question):
+        return SMALL_MODEL
+    return MODEL
+
+# Marcatori da non mostrare all'utente durante lo streaming
+THINK_OPEN = "<think>"
+ACTION_MARKER = "Action:"
+
+ACTION_RE = re.compile(r'Action:\s*(\w+)\s*Action Input:\s*')
+_json_decoder = json.JSONDecoder()
+
+def _scan_actions(response: str):
+    """Coppie (action, input) complete nella risposta (anche parziale) e testo che le segue."""
+    if THINK_OPEN in response and "</think>" not in response.rsplit(THINK_OPEN, 1)[1]:
+        return [], ""
+    text = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+    actions = []
+    pos = 0
+    while True:
+        match = ACTION_RE.search(text, pos)
+        if not match:
+            break
+        try:
+            # raw_decode legge un solo oggetto JSON e ignora il testo che segue
+            action_input, end = _json_decoder.raw_decode(text, match.end())
         except json.JSONDecodeError:
-            return None, None
-    return None, None
+            break
+        if isinstance(action_input, dict):
+            actions.append((match.group(1), action_input))
+        pos = end
+    return actions, text[pos:]
 
-def ask_agent(question: str, max_iterations: int = 5) -> str:
-    """Esegue il loop ReAct: Think -> Action -> Observation -> Answer"""
-    
-    scratchpad = ""
+def parse_actions(response: str) -> list:
+    """Estrae tutte le coppie Action / Action Input complete dalla risposta.
+
+    Ritorna [] finché il modello sta ancora pensando o il primo JSON non è completo:
+    si può chiamare a ogni chunk della risposta in streaming.
+    """
+    return _scan_actions(response)[0]
+
+def _actions_complete(response: str) -> bool:
+    """True se ci sono azioni complete e il testo successivo non è l'inizio di un'altra azione."""
+    actions, rest = _scan_actions(response)
+    rest = rest.lstrip()
+    if not actions or not rest:
+        return False
+    return not (rest.startswith(ACTION_MARKER) or ACTION_MARKER.startswith(rest))
+
+def _visible_text(response: str) -> str:
+    """Parte della risposta (parziale) mostrabile: senza <think>, fino a un eventuale Action."""
+    visible = re.sub(r'<think>.*?(?:</think>|$)', '', response, flags=re.DOTALL)
+    visible = visible.split(ACTION_MARKER)[0]
+    # Trattieni un marcatore ancora incompleto in coda (es. "<thi" o "Acti")
+    for marker in (THINK_OPEN, ACTION_MARKER):
+        for size in range(len(marker) - 1, 0, -1):
+            if visible.endswith(marker[:size]):
+                return visible[:-size]
+    return visible
+
+def stream_agent(question: str, max_iterations: int = 5, tracer: AgentTracer = None, model: str = None):
+    """Loop ReAct in streaming: genera eventi man mano che il modello produce token.
+
+    Eventi (dict con "type"):
+    - token:      {"content"}           - testo visibile, appena generato
+    - llm_end:    {"content"}           - risposta completa di un'iterazione
+    - tool_start: {"name", "input"}     - un tool è partito
+    - tool_end:   {"name", "output"}    - un tool ha finito
+    - final:      {"content"}           - risposta finale
+
+    tracer (opzionale): AgentTracer che raccoglie gli span del run (vedi instrumentation.py)
+    model (opzionale): modello Ollama da usare; di default lo sceglie choose_model()
+    """
+    tracer = tracer or AgentTracer()
+    with tracer.activate():
+        answer, vector = _cached_answer(question)
+        if answer is not None:
+            yield {"type": "final", "content": answer}
+            return
+        for event in _react_loop(question, max_iterations, {"callbacks": [tracer]}, model or choose_model(question)):
+            if event["type"] == "final":
+                # Prima di cedere "final": chi lo riceve (es. ask_agent) può chiudere il generatore
+                _remember_answer(question, event["content"], tracer, vector)
+            yield event
+
+def _generate(prompt: str, context: list = None, model: str = MODEL):
+    """Chiamata in streaming a /api/generate; con context il modello riparte da dove era rimasto."""
+    return client.generate(
+        model=model,
+        prompt=prompt,
+        # Il system prompt serve solo alla prima chiamata: poi è già dentro il context
+        system=SYSTEM_PROMPT if context is None else None,
+        context=context,
+        stream=True,
+        keep_alive=KEEP_ALIVE,
+        options=OPTIONS
+    )
+
+def _run_tool(name: str, action_input: dict, config: dict) -> str:
+    try:
+        return TOOLS_MAP[name].invoke(action_input, config=config)
+    except Exception as e:
+        return tool_error(str(e))
+
+def _run_actions(actions: list, config: dict):
+    """Esegue in parallelo le azioni di uno step; genera i tool_end e ritorna i risultati in ordine."""
+    results = [None] * len(actions)
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_TOOLS, len(actions))) as pool:
+        # Ogni thread gira in una copia del contesto corrente (tracing della richiesta)
+        futures = {
+            pool.submit(copy_context().run, _run_tool, name, action_input, config): i
+            for i, (name, action_input) in enumerate(actions)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            yield {"type": "tool_end", "name": actions[i][0], "output": results[i]}
+    return results
+
+def _react_loop(question: str, max_iterations: int, config: dict, model: str = MODEL):
+    # transcript: tutto il testo del run, per ripartire senza context se una generazione è stata interrotta
+    transcript = QUESTION_PROMPT.format(input=question)
+    prompt = transcript
+    context = None
     
     for i in range(max_iterations):
-        # Chiedi al modello
-        response = chain.invoke({
-            "tools_description": get_tools_description(),
-            "input": question,
-            "agent_scratchpad": scratchpad
-        })
+        # Chiedi al modello, token per token
+        response = ""
+        emitted = ""
+        t0 = time.perf_counter()
+        ttft = None
+        tokens = {}
+        stream = _generate(prompt, context, model)
+        sent_context = context
+        context = None
+        for chunk in stream:
+            if chunk.response and ttft is None:
+                ttft = round(time.perf_counter() - t0, 4)
+            response += chunk.response
+            visible = _visible_text(response).lstrip()
+            if len(visible) > len(emitted) and visible.startswith(emitted):
+                yield {"type": "token", "content": visible[len(emitted):]}
+                emitted = visible
+            if chunk.done:
+                # Token di prompt + risposta: la prossima iterazione continua da qui
+                context = chunk.context
+                tokens = {"input": chunk.prompt_eval_count or 0, "output": chunk.eval_count or 0}
+                break
+            if _actions_complete(response):
+                # Azioni complete e il modello è passato ad altro: interrompi la generazione
+                # (Ollama si ferma quando la connessione viene chiusa) ed esegui subito i tools.
+                # Uno stream chiuso non restituisce il context: si riparte da sent_context (sotto)
+                stream.close()
+                break
+        record_event("llm", model, time.perf_counter() - t0, ttft=ttft, tokens=tokens,
+                     stopped_early=context is None)
         
-        print(f"\n🤔 LLM Response:\n{response[:500]}...")
+        yield {"type": "llm_end", "content": response}
         
-        # Prova a estrarre un'azione
-        action, action_input = parse_action(response)
+        # Prova a estrarre le azioni
+        actions = parse_actions(response)
         
-        if action and action in TOOLS_MAP:
-            print(f"\n🔧 Executing: {action}({action_input})")
+        if any(action in TOOLS_MAP for action, _ in actions):
+            runnable = [(action, action_input) for action, action_input in actions if action in TOOLS_MAP]
+            for action, action_input in runnable:
+                yield {"type": "tool_start", "name": action, "input": action_input}
             
-            # Esegui il tool
-            tool = TOOLS_MAP[action]
-            try:
-                result = tool.invoke(action_input)
-                print(f"📊 Result: {result[:200]}...")
-            except Exception as e:
-                result = f"Error: {e}"
+            # Esegui i tools dello step in parallelo
+            results = iter((yield from _run_actions(runnable, config)))
             
-            # Aggiungi al scratchpad
-            scratchpad += f"\nAction: {action}\nAction Input: {action_input}\nObservation: {result}\n"
-            scratchpad += "Now provide your final answer based on this information.\n"
+            steps = []
+            lines = []
+            for action, action_input in actions:
+                if action in TOOLS_MAP:
+                    result = next(results)
+                else:
+                    # Nessun callback del tool: lo span di errore si registra qui (niente cache della risposta)
+                    result = tool_error(f"unknown tool '{action}'")
+                    record_event("tool", action, error="unknown tool")
+                steps.append(f"Action: {action}\nAction Input: {json.dumps(action_input)}")
+                lines.append(OBSERVATION_LINE.format(action=action, result=result))
+            observation = OBSERVATION_PROMPT.format(observations="\n".join(lines))
+            transcript += "\n\n" + "\n".join(steps) + "\n" + observation
+            if context:
+                # Generazione completa: azioni e ragionamento sono già nel context, bastano le osservazioni
+                prompt = observation
+            elif sent_context:
+                # Generazione interrotta: si riparte dal context inviato a questa iterazione, che non
+                # contiene il prompt appena inviato (le osservazioni dello step precedente): prompt,
+                # azioni eseguite e nuove osservazioni diventano il prossimo prompt. Così l'interruzione
+                # anticipata non annulla il riuso del context e nessun risultato dei tools va perso
+                context = sent_context
+                prompt = prompt + "\n\n" + "\n".join(steps) + "\n" + observation
+            else:
+                # Prima iterazione interrotta: nessun context, si rimanda il transcript
+                # (system prompt e domanda sono un prefisso già nella cache di Ollama)
+                prompt = transcript
         else:
             # Nessuna azione trovata, questa è la risposta finale
             # Rimuovi eventuali tag di thinking
             final = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
-            return final.strip()
+            yield {"type": "final", "content": final.strip()}
+            return
     
-    return "Max iterations reached. Please try a simpler question."
+    yield {"type": "final", "content": MAX_ITERATIONS_ANSWER}
 
+def ask_agent(question: str, max_iterations: int = 5, tracer: AgentTracer = None) -> str:
+    """Esegue il loop ReAct: Think -> Action -> Observation -> Answer"""
+    for event in stream_agent(question, max_iterations, tracer):
+        if event["type"] == "llm_end":
+            print(f"\n🤔 LLM Response:\n{event['content'][:500]}...")
+        elif event["type"] == "tool_start":
+            print(f"\n🔧 Executing: {event['name']}({event['input']})")
+        elif event["type"] == "tool_end":
+            print(f"📊 Result: {event['output'][:200]}...")
+        elif event["type"] == "final":
+            return event["content"]
 
 if __name__ == "__main__":
     print("\n" + "="*60)
     print("   🌍 Travel Agent AI - Test Mode (DeepSeek R1)")
     print("="*60)
+    if WARMUP:
+        warm_up()
+    print(f"🩺 Ollama: {health()}")
     
     # Test con una sola domanda per iniziare
     test_questions = [
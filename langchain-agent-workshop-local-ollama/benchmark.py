@@ -0,0 +1,33 @@
+# File: benchmark.py
+# Benchmark riproducibile dell'agente ReAct: replay offline di Ollama e API con latenza simulata
+# (runner e opzioni in agent_common/benchmark.py)
+#
+# 1. Registra le fixture (una volta, con Ollama avviato e rete):
+#        python benchmark.py --record
+# 2. Misura offline (nessuna chiamata esterna, latenze finte ma costanti):
+#        python benchmark.py --repeat 5 --llm-latency 3 --http-latency 0.1 --save results.json
+# 3. Confronta con un run precedente (exit code 1 se peggiora):
+#        python benchmark.py --baseline results.json
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.benchmark import run_benchmark  # noqa: E402
+
+QUESTIONS = [
+    "What's the weather in Rome?",
+    "Where is the Eiffel Tower?",
+    "What's the 3-day forecast for Tokyo?",
+    "Tell me about Japan: capital, currency and languages.",
+    "How much is 250 USD in EUR?",
+]
+
+
+def load_agent():
+    import agent
+    return agent
+
+
+if __name__ == "__main__":
+    run_benchmark(load_agent, QUESTIONS, "Benchmark offline del Travel Agent (Ollama)", llm_latency=3.0)
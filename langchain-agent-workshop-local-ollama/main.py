@@ -1,7 +1,33 @@
 # File: main.py
 # Entry point con chat loop interattivo
 
-from agent import ask_agent
+import os
+from agent import ask_agent, stream_agent, health, warm_up, calibrate_answer_cache, WARMUP
+
+# Streaming: mostra tool e token della risposta appena arrivano (AGENT_STREAMING=0 per disattivarlo)
+STREAMING = os.getenv("AGENT_STREAMING", "1") == "1"
+
+def stream_answer(question: str) -> str:
+    """Stampa gli eventi dell'agente in tempo reale e ritorna la risposta finale."""
+    response = ""
+    answering = False
+    for event in stream_agent(question):
+        if event["type"] == "tool_start":
+            print(f"\n🔧 {event['name']}({event['input']})")
+            answering = False
+        elif event["type"] == "tool_end":
+            print(f"📊 {event['name']} ✓")
+        elif event["type"] == "token":
+            if not answering:
+                print("\n🤖 Agente: ", end="", flush=True)
+                answering = True
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "final":
+            response = event["content"]
+    if not answering:
+        print(f"\n🤖 Agente: {response}", end="")
+    print()
+    return response
 
 def main():
     print("\n" + "="*60)
@@ -13,6 +39,16 @@ def main():
     print("  'quit' o 'exit' - Esci")
     print("="*60)
     
+    # Ollama deve essere raggiungibile; il warm-up carica subito i modelli
+    status = health()
+    if "error" in status:
+        print(f"\n❌ Ollama non raggiungibile: {status['error']}")
+    elif WARMUP:
+        print("\n⏳ Caricamento modelli...")
+        warm_up()
+    else:
+        calibrate_answer_cache()
+    
     while True:
         try:
             user_input = input("\n👤 Tu: ").strip()
@@ -26,9 +62,11 @@ def main():
             
             # Chiedi all'agente
             print("\n🤔 Sto pensando...")
-            response = ask_agent(user_input)
-            
-            print(f"\n🤖 Agente: {response}")
+            if STREAMING:
+                stream_answer(user_input)
+            else:
+                response = ask_agent(user_input)
+                print(f"\n🤖 Agente: {response}")
             
         except KeyboardInterrupt:
             print("\n\n👋 Interrotto. Arrivederci!")
@@ -2,6 +2,7 @@
 # Tools per l'agente di viaggio
 
 import requests
+import threading
 from langchain.tools import tool
 from typing import Optional
 
@@ -11,6 +12,9 @@ HEADERS = {
     'Accept-Language': 'en'
 }
 
+# Le azioni di uno step girano in parallelo: le ricerche su Nominatim restano in fila
+_nominatim_lock = threading.Lock()
+
 print("✅ Tools module loaded")
 
 # Continua in tools.py
@@ -28,7 +32,6 @@ def search_location(query: str) -> str:
         Location details including coordinates, country, and display name.
     """
     import time
-    time.sleep(1)  # Rispetta rate limit di Nominatim
     
     url = "https://nominatim.openstreetmap.org/search"
     params = {
@@ -39,7 +42,9 @@ def search_location(query: str) -> str:
     }
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
+        with _nominatim_lock:
+            time.sleep(1)  # Rispetta rate limit di Nominatim
+            response = requests.get(url, params=params, headers=HEADERS, timeout=10)
         response.raise_for_status()
         data = response.json()
     except Exception as e:
@@ -2,12 +2,22 @@
 # Agente LangChain con tools
 
 import os
+import sys
+import asyncio
+import contextvars
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.agents import create_openai_tools_agent, AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import SystemMessage
+from langchain_core.tools import StructuredTool
 from tools import ALL_TOOLS
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.instrumentation import AgentTracer, record_event, tool_error  # noqa: E402
+from agent_common.semantic_cache import SemanticCache, answer_ttl, ENABLED as SEMANTIC_CACHE_ENABLED  # noqa: E402
+
 # Carica environment variables
 load_dotenv()
 
@@ -15,7 +25,8 @@ load_dotenv()
 llm = ChatOpenAI(
     model="gpt-4o-mini",
     temperature=0,
-    api_key=os.getenv("OPENAI_API_KEY")
+    api_key=os.getenv("OPENAI_API_KEY"),
+    stream_usage=True  # Conteggio token anche in streaming (tracing)
 )
 
 print(f"✅ LLM configured: {llm.model_name}")
@@ -29,20 +40,25 @@ SYSTEM_PROMPT = """You are a helpful travel assistant AI. You help users with:
 - Providing travel tips and recommendations
 
 When answering questions:
-1. Use the search_location tool to find coordinates of places
-2. Use get_weather or get_forecast for weather information
-3. Use get_country_info for country details (currency, language, etc.)
-4. Use convert_currency for money conversions
+1. For weather, call get_weather_by_place or get_forecast_by_place directly with the place name
+2. For several places, call get_weather_for_places once with the whole list
+3. Use search_location only when the user needs coordinates or place details
+   (get_weather/get_forecast take coordinates you already have)
+4. Use get_country_info for country details (currency, language, etc.)
+5. Use convert_currency for money conversions
 
 Always provide helpful, accurate information based on the tool results.
 If you need multiple pieces of information, call multiple tools.
+When tool calls don't depend on each other (e.g. several cities), request them all in the same step.
 Be concise but complete in your responses.
 
 Respond in the same language the user uses (Italian or English)."""
 
-# Crea prompt template
+# Crea prompt template (system come messaggio già pronto: nessun re-render per turno).
+# System prompt e tools sono identici a ogni turno: un prefisso che OpenAI può riusare
+# dalla sua prompt cache (lato provider, prefissi >= 1024 token)
 prompt = ChatPromptTemplate.from_messages([
-    ("system", SYSTEM_PROMPT),
+    SystemMessage(content=SYSTEM_PROMPT),
     MessagesPlaceholder(variable_name="chat_history", optional=True),
     ("human", "{input}"),
     MessagesPlaceholder(variable_name="agent_scratchpad")
@@ -64,17 +80,226 @@ agent_executor = AgentExecutor(
     max_iterations=10  # Limite iterazioni per sicurezza
 )
 
+# Modalità parallela: i tool call indipendenti di uno stesso step girano in concorrenza
+# (AgentExecutor.ainvoke li esegue con asyncio.gather, mantenendo l'ordine e i tool_call_id)
+PARALLEL_TOOLS = os.getenv("AGENT_PARALLEL_TOOLS", "1") == "1"
+MAX_CONCURRENT_TOOLS = int(os.getenv("AGENT_MAX_CONCURRENT_TOOLS", "4"))  # Per run (domanda), non per processo
+TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "20"))
+# Timeout specifici (secondi): i tools con geocoding possono attendere il rate limit di Nominatim
+TOOL_TIMEOUTS = {
+    "search_location": 30,
+    "get_weather_by_place": 30,
+    "get_forecast_by_place": 30,
+    "get_weather_for_places": 60
+}
+
+# Semaforo del run in corso: nel server ogni sessione ha il suo, anche se l'event loop è lo stesso
+# (i task dei tools ereditano il contesto del run che li avvia)
+_run_tool_slots = contextvars.ContextVar("run_tool_slots", default=None)
+_loop = None  # Event loop persistente per ask_agent: i pool HTTP async restano vivi tra i turni
+
+@contextmanager
+def tool_limits():
+    """Apre un run: fino a MAX_CONCURRENT_TOOLS tools in parallelo al suo interno."""
+    token = _run_tool_slots.set(asyncio.Semaphore(MAX_CONCURRENT_TOOLS))
+    try:
+        yield
+    finally:
+        _run_tool_slots.reset(token)
+
+def _tool_slot() -> asyncio.Semaphore:
+    # Fuori da un run (es. tool invocato direttamente) il limite vale per la singola chiamata
+    return _run_tool_slots.get() or asyncio.Semaphore(MAX_CONCURRENT_TOOLS)
+
+def with_limits(tool) -> StructuredTool:
+    """Wrappa un tool con il cap di concorrenza del run e il suo timeout."""
+    timeout = TOOL_TIMEOUTS.get(tool.name, TOOL_TIMEOUT)
+
+    async def run(**kwargs):
+        async with _tool_slot():
+            try:
+                # Chiama direttamente l'implementazione async: il run del tool è già quello esterno
+                return await asyncio.wait_for(tool.coroutine(**kwargs), timeout)
+            except asyncio.TimeoutError:
+                return tool_error(f"{tool.name} timed out after {timeout:.0f}s")
+
+    return StructuredTool.from_function(
+        func=tool.func,
+        coroutine=run,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema
+    )
+
+PARALLEL_TOOLS_LIST = [with_limits(tool) for tool in ALL_TOOLS]
+
+parallel_agent_executor = AgentExecutor(
+    agent=agent,
+    tools=PARALLEL_TOOLS_LIST,
+    verbose=True,
+    handle_parsing_errors=True,
+    max_iterations=10
+)
+
+# Executor per lo streaming: gli eventi li stampa il chat loop, quindi niente verbose
+streaming_agent_executor = AgentExecutor(
+    agent=agent,
+    tools=PARALLEL_TOOLS_LIST,
+    verbose=False,
+    handle_parsing_errors=True,
+    max_iterations=10
+)
+
 print("✅ Agent created and ready!")
 
+# Cache semantica delle risposte: domande equivalenti non rifanno LLM e tools
+# Le domande sono brevi: niente suddivisione in chunk con tiktoken
+embeddings = OpenAIEmbeddings(
+    model="text-embedding-3-small",
+    api_key=os.getenv("OPENAI_API_KEY"),
+    check_embedding_ctx_length=False
+)
+answer_cache = SemanticCache(embeddings.embed_query, embed_many=embeddings.embed_documents) if SEMANTIC_CACHE_ENABLED else None
+
+def calibrate_answer_cache():
+    """Calibra la soglia della cache semantica all'avvio (non dentro la prima domanda)."""
+    if answer_cache is None or answer_cache.threshold is not None:
+        return
+    try:
+        answer_cache.calibrate()
+    except Exception as e:
+        print(f"⚠️ Semantic cache calibration failed, exact matches only: {e}")
+
+def _cached_answer(question: str, chat_history: list = None):
+    """(risposta in cache o None, embedding della domanda). Solo senza cronologia:
+    con una conversazione in corso la stessa domanda può voler dire altro."""
+    if answer_cache is None or chat_history:
+        return None, None
+    try:
+        answer, vector = answer_cache.get(question)
+    except Exception as e:
+        print(f"⚠️ Semantic cache unavailable: {e}")
+        return None, None
+    if answer is not None:
+        record_event("cache_hit", "answer")
+    return answer, vector
+
+def _remember_answer(question: str, chat_history: list, answer: str, tracer: AgentTracer, vector=None):
+    """Salva la risposta con il TTL del tool più "fresco" usato; mai risposte con errori."""
+    if answer_cache is None or chat_history or not answer or answer.startswith("Agent stopped"):
+        return
+    if any("error" in span for span in tracer.spans):
+        return
+    try:
+        answer_cache.put(question, answer, answer_ttl(tracer.summary()["tools"]), vector)
+    except Exception as e:
+        print(f"⚠️ Semantic cache unavailable: {e}")
+
 # Funzione helper per invocare l'agente
-def ask_agent(question: str, chat_history: list = None) -> str:
+# tracer (opzionale): AgentTracer che raccoglie gli span del run (vedi instrumentation.py)
+def ask_agent(question: str, chat_history: list = None, tracer: AgentTracer = None) -> str:
     """Invia domanda all'agente e ritorna risposta."""
-    result = agent_executor.invoke({
-        "input": question,
-        "chat_history": chat_history or []
-    })
+    if PARALLEL_TOOLS:
+        return _get_loop().run_until_complete(aask_agent(question, chat_history, tracer))
+    tracer = tracer or AgentTracer()
+    with tracer.activate():
+        answer, vector = _cached_answer(question, chat_history)
+        if answer is not None:
+            return answer
+        result = agent_executor.invoke({
+            "input": question,
+            "chat_history": chat_history or []
+        }, config={"callbacks": [tracer]})
+    _remember_answer(question, chat_history, result["output"], tracer, vector)
+    return result["output"]
+
+async def aask_agent(question: str, chat_history: list = None, tracer: AgentTracer = None) -> str:
+    """Versione async: i tool call dello stesso step vengono eseguiti in parallelo."""
+    tracer = tracer or AgentTracer()
+    with tracer.activate(), tool_limits():
+        answer, vector = await asyncio.to_thread(_cached_answer, question, chat_history)
+        if answer is not None:
+            return answer
+        result = await parallel_agent_executor.ainvoke({
+            "input": question,
+            "chat_history": chat_history or []
+        }, config={"callbacks": [tracer]})
+    await asyncio.to_thread(_remember_answer, question, chat_history, result["output"], tracer, vector)
     return result["output"]
 
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+async def astream_agent(question: str, chat_history: list = None, tracer: AgentTracer = None):
+    """Genera gli eventi dell'agente man mano che accadono.
+
+    Eventi (dict con "type"):
+    - tool_start: {"name", "input"}   - un tool è partito
+    - tool_end:   {"name", "output"}  - un tool ha finito
+    - token:      {"content"}         - token della risposta finale, appena generato
+    - final:      {"content"}         - risposta completa
+    """
+    tracer = tracer or AgentTracer()
+    with tracer.activate(), tool_limits():
+        answer, vector = await asyncio.to_thread(_cached_answer, question, chat_history)
+        if answer is not None:
+            yield {"type": "final", "content": answer}
+            return
+        async for event in streaming_agent_executor.astream_events(
+            {"input": question, "chat_history": chat_history or []},
+            config={"callbacks": [tracer]},
+            version="v2"
+        ):
+            kind = event["event"]
+            if kind == "on_tool_start":
+                yield {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+            elif kind == "on_tool_end":
+                yield {"type": "tool_end", "name": event["name"], "output": str(event["data"].get("output"))}
+            elif kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    yield {"type": "token", "content": content}
+            elif kind == "on_chain_end" and not event["parent_ids"]:
+                answer = event["data"]["output"]["output"]
+                # Prima di cedere "final": chi lo riceve può chiudere il generatore
+                await asyncio.to_thread(_remember_answer, question, chat_history, answer, tracer, vector)
+                yield {"type": "final", "content": answer}
+
+def stream_agent(question: str, chat_history: list = None, tracer: AgentTracer = None):
+    """Versione sync di astream_agent, per il chat loop.
+
+    Il generatore async gira tutto in un unico Task sul loop persistente e passa gli eventi
+    da una coda: tracer e limiti del run sono contextvar, vanno impostati e ripristinati
+    nello stesso contesto (un run_until_complete per evento userebbe un Task diverso ogni volta).
+    """
+    loop = _get_loop()
+    events = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for event in astream_agent(question, chat_history, tracer):
+                events.put_nowait(event)
+        finally:
+            events.put_nowait(done)
+
+    task = loop.create_task(pump())
+    try:
+        while (event := loop.run_until_complete(events.get())) is not done:
+            yield event
+        loop.run_until_complete(task)  # Rilancia l'eventuale errore dell'agente
+    finally:
+        if not task.done():
+            # Il chiamante ha smesso di leggere: chiudi il run (e i suoi tools)
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+
 # Test standalone
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+# File: benchmark.py
+# Benchmark riproducibile dell'agente: replay offline di LLM e API con latenza simulata
+# (runner e opzioni in agent_common/benchmark.py)
+#
+# 1. Registra le fixture (una volta, con rete e OPENAI_API_KEY):
+#        python benchmark.py --record
+# 2. Misura offline (nessuna chiamata esterna, latenze finte ma costanti):
+#        python benchmark.py --repeat 5 --llm-latency 0.8 --http-latency 0.1 --save results.json
+# 3. Confronta con un run precedente (exit code 1 se peggiora):
+#        python benchmark.py --baseline results.json
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.benchmark import run_benchmark  # noqa: E402
+
+QUESTIONS = [
+    "What's the weather like in Rome right now?",
+    "Compare the current weather in Paris, Berlin and Madrid.",
+    "What's the 3-day forecast for Tokyo?",
+    "Tell me about Japan: capital, currency and languages.",
+    "How much is 250 USD in EUR?",
+    "I'm going to Lisbon next week: what's the forecast and how many euros do I get for 500 USD?",
+]
+
+
+def load_agent():
+    import agent
+    return agent
+
+
+def reset():
+    from cache import cache
+    cache.clear()  # Ogni ripetizione parte a freddo: misura i tools, non la cache
+
+
+if __name__ == "__main__":
+    run_benchmark(load_agent, QUESTIONS, "Benchmark offline del Travel Agent", llm_latency=0.8, reset=reset)
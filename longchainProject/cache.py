@@ -0,0 +1,99 @@
+# File: cache.py
+# Cache a due livelli per le risposte dei tools: LRU in memoria + SQLite su disco (opzionale)
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# TTL per tipo di dato (secondi): geocoding e paesi cambiano di rado, il meteo spesso
+TTLS = {
+    "geocode": 30 * 24 * 3600,
+    "country": 7 * 24 * 3600,
+    "fx": 3600,
+    "forecast": 30 * 60,
+    "weather": 10 * 60,
+}
+DEFAULT_TTL = 600
+
+MAX_ENTRIES = int(os.getenv("TOOLS_CACHE_SIZE", "1024"))
+CACHE_DB = os.getenv("TOOLS_CACHE_DB")  # es. ./tools_cache.sqlite (non impostato = solo memoria)
+
+
+class TieredCache:
+    """LRU in memoria davanti a una tabella SQLite opzionale, con TTL per namespace."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, db_path: str = None):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()  # (namespace, key) -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, expires_at REAL, value TEXT, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self.db.commit()
+
+    def get(self, namespace: str, key: str):
+        """Ritorna il valore in cache o None se assente/scaduto."""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get((namespace, key))
+            if entry and entry[0] > now:
+                self.memory.move_to_end((namespace, key))
+                self.hits["memory"] += 1
+                return entry[1]
+
+            if self.db:
+                row = self.db.execute(
+                    "SELECT expires_at, value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (namespace, key, now)
+                ).fetchone()
+                if row:
+                    value = json.loads(row[1])
+                    self._remember(namespace, key, row[0], value)
+                    self.hits["disk"] += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else TTLS.get(namespace, DEFAULT_TTL))
+        with self.lock:
+            self._remember(namespace, key, expires_at, value)
+            if self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (namespace, key, expires_at, json.dumps(value))
+                )
+                self.db.commit()
+
+    def _remember(self, namespace, key, expires_at, value):
+        self.memory[(namespace, key)] = (expires_at, value)
+        self.memory.move_to_end((namespace, key))
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.memory), "hits": dict(self.hits), "misses": self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db:
+                self.db.execute("DELETE FROM cache")
+                self.db.commit()
+
+
+# Cache condivisa da tutti i tools del processo
+cache = TieredCache(db_path=CACHE_DB)
@@ -0,0 +1,88 @@
+# File: history.py
+# Cronologia chat con budget di token e riassunto incrementale dei turni più vecchi
+
+import os
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "1") == "1"
+# Quando il budget è superato si scende fino a questa frazione: così la cronologia
+# (e quindi il prefisso del prompt) resta identica per diversi turni e il prompt
+# caching del provider continua a colpire, invece di cambiare a ogni turno
+LOW_WATERMARK = 0.6
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a travel assistant.
+
+Current summary:
+{summary}
+
+New messages to fold into the summary:
+{messages}
+
+Write the updated summary in at most 120 words. Keep places, dates, amounts, currencies
+and user preferences; drop small talk. Use the same language as the conversation."""
+
+
+class ChatHistory:
+    """Cronologia con budget di token: i turni vecchi escono e confluiscono in un riassunto."""
+
+    def __init__(self, llm, max_tokens: int = HISTORY_MAX_TOKENS, summarize: bool = HISTORY_SUMMARY):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.turns = []  # [(HumanMessage, AIMessage, tokens)] - token contati una volta sola
+        self.summary = ""
+        self.summary_tokens = 0
+
+    def messages(self) -> list:
+        """Messaggi da passare come chat_history ad ask_agent."""
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        for human, ai, _ in self.turns:
+            messages.extend([human, ai])
+        return messages
+
+    def total_tokens(self) -> int:
+        return self.summary_tokens + sum(tokens for _, _, tokens in self.turns)
+
+    def add_turn(self, question: str, answer: str):
+        dropped = self._append(question, answer)
+        if dropped and self.summarize:
+            summary = self.llm.invoke(self._summary_prompt(dropped)).content
+            self._set_summary(summary)
+
+    async def aadd_turn(self, question: str, answer: str):
+        dropped = self._append(question, answer)
+        if dropped and self.summarize:
+            summary = (await self.llm.ainvoke(self._summary_prompt(dropped))).content
+            self._set_summary(summary)
+
+    def clear(self):
+        self.turns = []
+        self.summary = ""
+        self.summary_tokens = 0
+
+    def _append(self, question: str, answer: str) -> list:
+        """Aggiunge il turno e, se serve, rimuove i più vecchi; ritorna i turni rimossi."""
+        tokens = self.llm.get_num_tokens(question) + self.llm.get_num_tokens(answer)
+        self.turns.append((HumanMessage(content=question), AIMessage(content=answer), tokens))
+
+        if self.total_tokens() <= self.max_tokens:
+            return []
+        dropped = []
+        # L'ultimo turno resta sempre, anche se da solo supera il budget
+        while len(self.turns) > 1 and self.total_tokens() > self.max_tokens * LOW_WATERMARK:
+            dropped.append(self.turns.pop(0))
+        return dropped
+
+    def _summary_prompt(self, dropped: list) -> str:
+        lines = []
+        for human, ai, _ in dropped:
+            lines.append(f"User: {human.content}")
+            lines.append(f"Assistant: {ai.content}")
+        return SUMMARY_PROMPT.format(summary=self.summary or "(empty)", messages="\n".join(lines))
+
+    def _set_summary(self, summary: str):
+        self.summary = summary.strip()
+        self.summary_tokens = self.llm.get_num_tokens(self.summary)
@@ -0,0 +1,156 @@
+# File: http_client.py
+# Client HTTP condivisi per i tools: connessioni keep-alive, limite per host e retry
+
+import asyncio
+import os
+import sys
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limit import get_limiter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.instrumentation import record_event  # noqa: E402
+
+TIMEOUT = 10
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5  # Attese tra i retry: 0.5s, 1s, 2s
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class UpstreamHTTPError(Exception):
+    """Risposta HTTP non 2xx da un servizio esterno (dopo i retry)."""
+
+    def __init__(self, url: str, status_code: int):
+        super().__init__(f"HTTP {status_code} from {url}")
+        self.url = url
+        self.status_code = status_code
+
+
+# --- Client sync (requests) ---
+
+def _create_session(retries: int = MAX_RETRIES) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET"],
+        raise_on_status=False
+    )
+    # pool_maxsize vale per host: ogni upstream ha il suo pool di connessioni riusate
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+        pool_block=True,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+session = _create_session()
+# Host con rate limit: urllib3 ripeterebbe la richiesta senza passare dal limiter,
+# quindi niente retry qui; li fa get_json, prendendo un token a ogni tentativo
+limited_session = _create_session(retries=0)
+
+
+def _throttle(limiter, host: str):
+    waited = limiter.acquire()
+    if waited:
+        record_event("throttle", host, waited)
+
+
+def get_json(url: str, params: dict = None, headers: dict = None, timeout: float = TIMEOUT):
+    """GET sincrono sul pool condiviso; ritorna il JSON o solleva UpstreamHTTPError."""
+    host = urlsplit(url).netloc
+    limiter = get_limiter(host)
+    t0 = time.perf_counter()
+    if limiter is None:
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+    else:
+        for attempt in range(MAX_RETRIES + 1):
+            _throttle(limiter, host)
+            try:
+                response = limited_session.get(url, params=params, headers=headers, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+            record_event("retry", host, attempt=attempt + 1)
+            time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+    record_event("http", host, time.perf_counter() - t0, status=response.status_code)
+    if response.status_code >= 400:
+        raise UpstreamHTTPError(url, response.status_code)
+    return response.json()
+
+
+# --- Client async (httpx) ---
+
+class _LoopClients:
+    """AsyncClient e semafori per host legati a un singolo event loop."""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+        self.host_slots = {}
+
+    def slot(self, host: str) -> asyncio.Semaphore:
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+        return self.host_slots[host]
+
+# httpx.AsyncClient non può essere condiviso tra event loop diversi (es. più asyncio.run)
+_loop_clients = weakref.WeakKeyDictionary()
+
+def _clients() -> _LoopClients:
+    loop = asyncio.get_running_loop()
+    if loop not in _loop_clients:
+        _loop_clients[loop] = _LoopClients()
+    return _loop_clients[loop]
+
+
+async def aget_json(url: str, params: dict = None, headers: dict = None, timeout: float = TIMEOUT):
+    """GET asincrono con keep-alive, limite di connessioni per host e retry con backoff."""
+    host = urlsplit(url).netloc
+    limiter = get_limiter(host)
+    clients = _clients()
+    t0 = time.perf_counter()
+    async with clients.slot(host):
+        for attempt in range(MAX_RETRIES + 1):
+            # Un token per tentativo: anche i retry rispettano la policy dell'host
+            if limiter:
+                waited = await limiter.aacquire()
+                if waited:
+                    record_event("throttle", host, waited)
+            try:
+                response = await clients.client.get(url, params=params, headers=headers, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    break
+            except httpx.TransportError:
+                if attempt == MAX_RETRIES:
+                    raise
+            record_event("retry", host, attempt=attempt + 1)
+            await asyncio.sleep(BACKOFF_FACTOR * 2 ** attempt)
+    record_event("http", host, time.perf_counter() - t0, status=response.status_code)
+
+    if response.status_code >= 400:
+        raise UpstreamHTTPError(url, response.status_code)
+    return response.json()
+
+
+async def aclose():
+    """Chiude l'AsyncClient dell'event loop corrente."""
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.pop(loop, None)
+    if clients:
+        await clients.client.aclose()
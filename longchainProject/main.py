@@ -1,8 +1,43 @@
 # File: main.py
 # Entry point con chat loop interattivo
 
-from agent import ask_agent, agent_executor
-from langchain_core.messages import HumanMessage, AIMessage
+import os
+from agent import ask_agent, stream_agent, agent_executor, llm, calibrate_answer_cache
+from history import ChatHistory
+
+# Streaming: mostra tool e token della risposta appena arrivano (AGENT_STREAMING=0 per disattivarlo)
+STREAMING = os.getenv("AGENT_STREAMING", "1") == "1"
+
+def stream_answer(question: str, chat_history: list) -> str:
+    """Stampa gli eventi dell'agente in tempo reale e ritorna la risposta finale."""
+    response = ""
+    answering = False
+    for event in stream_agent(question, chat_history):
+        if event["type"] == "tool_start":
+            print(f"🔧 {event['name']}({event['input']})")
+        elif event["type"] == "tool_end":
+            print(f"📊 {event['name']} ✓")
+        elif event["type"] == "token":
+            if not answering:
+                print("\n🤖 Agente: ", end="", flush=True)
+                answering = True
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "final":
+            response = event["content"]
+    if not answering:
+        print(f"\n🤖 Agente: {response}", end="")
+    print()
+    return response
+
+def chat_turn(user_input: str, chat_history: ChatHistory) -> str:
+    """Un turno del chat loop: risposta dell'agente e aggiornamento della cronologia."""
+    if STREAMING:
+        response = stream_answer(user_input, chat_history.messages())
+    else:
+        response = ask_agent(user_input, chat_history.messages())
+        print(f"\n🤖 Agente: {response}")
+    chat_history.add_turn(user_input, response)
+    return response
 
 def main():
     print("\n" + "="*60)
@@ -15,7 +50,10 @@ def main():
     print("  'clear' - Pulisci cronologia chat")
     print("="*60)
     
-    chat_history = []
+    calibrate_answer_cache()
+    
+    # Cronologia con budget di token (i turni vecchi vengono riassunti)
+    chat_history = ChatHistory(llm)
     
     while True:
         try:
@@ -29,19 +67,13 @@ def main():
                 break
             
             if user_input.lower() == 'clear':
-                chat_history = []
+                chat_history.clear()
                 print("🗑️ Cronologia chat pulita.")
                 continue
             
             # Chiedi all'agente
             print("\n🤔 Sto pensando...")
-            response = ask_agent(user_input, chat_history)
-            
-            # Aggiorna cronologia
-            chat_history.append(HumanMessage(content=user_input))
-            chat_history.append(AIMessage(content=response))
-            
-            print(f"\n🤖 Agente: {response}")
+            chat_turn(user_input, chat_history)
             
         except KeyboardInterrupt:
             print("\n\n👋 Interrotto. Arrivederci!")
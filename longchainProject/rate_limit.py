@@ -0,0 +1,79 @@
+# File: rate_limit.py
+# Rate limiter token bucket per host upstream, condiviso da tutto il processo
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` richieste/secondo con burst massimo `capacity`.
+
+    Ogni richiesta prenota un token; se il bucket è vuoto la prenotazione va "in debito"
+    e il chiamante attende solo il tempo necessario a rientrare nella policy.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        # Contatori
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    def reserve(self) -> float:
+        """Prenota un token e ritorna i secondi da attendere prima di usarlo (0 = subito)."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+            self.requests += 1
+            if wait > 0:
+                self.throttled += 1
+                self.throttled_seconds += wait
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "throttled_seconds": round(self.throttled_seconds, 3)
+            }
+
+
+# Policy per host (es. "nominatim.openstreetmap.org" -> 1 req/s)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def set_rate_limit(host: str, rate: float, capacity: int = 1):
+    """Registra (o sostituisce) la policy di un host."""
+    with _limiters_lock:
+        _limiters[host] = TokenBucket(rate, capacity)
+
+def get_limiter(host: str):
+    """Ritorna il limiter dell'host, o None se l'host non ha una policy."""
+    return _limiters.get(host)
+
+def limiter_stats() -> dict:
+    """Contatori di tutti i limiter: richieste, richieste rallentate, secondi di attesa."""
+    return {host: limiter.stats() for host, limiter in _limiters.items()}
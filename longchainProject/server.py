@@ -0,0 +1,210 @@
+# File: server.py
+# Server async multi-sessione (HTTP + WebSocket) attorno all'agente di viaggio
+#
+# Avvio: uvicorn server:app --port 8000
+# - POST   /sessions                    -> crea una sessione
+# - POST   /sessions/{id}/messages      -> {"message": "..."} -> {"answer": "..."}
+# - WS     /sessions/{id}/ws            -> invia {"message": "..."}, ricevi gli eventi in streaming
+# - DELETE /sessions/{id}               -> chiude la sessione
+# - GET    /health                      -> sessioni, run attivi, cache e rate limit
+# - GET    /metrics                     -> istogrammi di latenza (LLM, tools, HTTP, throttling)
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from contextlib import aclosing, asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+import http_client
+from agent import astream_agent, llm, answer_cache, calibrate_answer_cache
+from cache import cache
+from history import ChatHistory
+from rate_limit import limiter_stats
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.instrumentation import histograms  # noqa: E402
+
+MAX_CONCURRENT_RUNS = int(os.getenv("SERVER_MAX_CONCURRENT_RUNS", "16"))  # Run dell'agente in parallelo
+MAX_WAITING_RUNS = int(os.getenv("SERVER_MAX_WAITING_RUNS", "32"))        # In coda, oltre si rifiuta
+MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "500"))
+SESSION_IDLE_TIMEOUT = int(os.getenv("SERVER_SESSION_IDLE_TIMEOUT", "3600"))
+
+
+class Busy(Exception):
+    """Il server (o la sessione) non può accettare altro lavoro adesso."""
+
+
+class RunLimiter:
+    """Limite globale di run concorrenti con una coda limitata (backpressure)."""
+
+    def __init__(self, max_running: int, max_waiting: int):
+        self.slots = asyncio.Semaphore(max_running)
+        self.max_waiting = max_waiting
+        self.running = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.slots.locked() and self.waiting >= self.max_waiting:
+            raise Busy("Server busy, retry later")
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.slots.release()
+
+
+class Session:
+    """Conversazione di un utente: cronologia propria, un turno alla volta."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.history = ChatHistory(llm)
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+sessions = {}
+limiter = RunLimiter(MAX_CONCURRENT_RUNS, MAX_WAITING_RUNS)
+
+
+async def run_turn(session: Session, message: str):
+    """Esegue un turno della sessione e genera gli eventi dell'agente (vedi astream_agent)."""
+    # Un solo turno alla volta per sessione: un secondo messaggio concorrente viene rifiutato
+    if session.lock.locked():
+        raise Busy("Session is already processing a message")
+    async with session.lock, limiter.slot():
+        session.last_used = time.monotonic()
+        answer = ""
+        async for event in astream_agent(message, session.history.messages()):
+            if event["type"] == "final":
+                answer = event["content"]
+            yield event
+        await session.history.aadd_turn(message, answer)
+        session.last_used = time.monotonic()
+
+
+async def expire_sessions():
+    """Chiude le sessioni inattive da più di SESSION_IDLE_TIMEOUT secondi."""
+    while True:
+        await asyncio.sleep(60)
+        now = time.monotonic()
+        for session_id, session in list(sessions.items()):
+            if not session.lock.locked() and now - session.last_used > SESSION_IDLE_TIMEOUT:
+                sessions.pop(session_id, None)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(calibrate_answer_cache)
+    cleaner = asyncio.create_task(expire_sessions())
+    yield
+    cleaner.cancel()
+    await http_client.aclose()
+
+app = FastAPI(title="Travel Agent AI", lifespan=lifespan)
+
+
+class MessageRequest(BaseModel):
+    message: str
+
+
+def get_session(session_id: str) -> Session:
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.post("/sessions")
+async def create_session():
+    if len(sessions) >= MAX_SESSIONS:
+        raise HTTPException(status_code=503, detail="Too many open sessions")
+    session = Session()
+    sessions[session.id] = session
+    return {"session_id": session.id}
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    get_session(session_id)
+    sessions.pop(session_id, None)
+    return {"deleted": session_id}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def send_message(session_id: str, request: MessageRequest):
+    session = get_session(session_id)
+    answer = ""
+    tools_used = []
+    try:
+        async for event in run_turn(session, request.message):
+            if event["type"] == "tool_start":
+                tools_used.append(event["name"])
+            elif event["type"] == "final":
+                answer = event["content"]
+    except Busy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "2"})
+    return {"answer": answer, "tools": tools_used}
+
+
+@app.websocket("/sessions/{session_id}/ws")
+async def session_socket(websocket: WebSocket, session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"type": "error", "status": 400, "content": "Invalid JSON"})
+                continue
+            message = data.get("message") if isinstance(data, dict) else None
+            if not isinstance(message, str) or not message.strip():
+                await websocket.send_json({"type": "error", "status": 400, "content": "Expected {\"message\": \"...\"}"})
+                continue
+            # Un errore dell'agente o di un tool chiude solo il turno, non la sessione
+            try:
+                # aclosing: se l'invio fallisce a metà, il turno viene chiuso subito (e il lock rilasciato)
+                async with aclosing(run_turn(session, message)) as events:
+                    async for event in events:
+                        await websocket.send_json(event)
+            except Busy as e:
+                await websocket.send_json({"type": "error", "status": 429, "content": str(e)})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"❌ Session {session.id}: turn failed: {type(e).__name__}: {e}")
+                await websocket.send_json({"type": "error", "status": 500, "content": f"{type(e).__name__}: {e}"})
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "sessions": len(sessions),
+        "runs": {"running": limiter.running, "waiting": limiter.waiting},
+        "cache": cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "rate_limits": limiter_stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return histograms()
@@ -0,0 +1,123 @@
+# File: test_streaming.py
+# Streaming sync dell'agente (chat loop): il run deve arrivare in fondo in un solo contesto,
+# così tracer, cache delle risposte e cronologia vengono aggiornati.
+#
+# Avvio: python -m pytest -q test_streaming.py   (nessuna chiamata a OpenAI: executor e cache finti)
+
+import asyncio
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import agent  # noqa: E402
+import main  # noqa: E402
+from history import ChatHistory  # noqa: E402
+from agent_common.instrumentation import AgentTracer, current_tracer  # noqa: E402
+
+QUESTION = "Che tempo fa a Milano?"
+ANSWER = "A Milano c'è il sole, 21°C."
+
+
+class FakeExecutor:
+    """Eventi di astream_events per un run con un tool; controlla che il tracer resti attivo."""
+
+    def __init__(self, tool_seconds=0.0):
+        self.tool_seconds = tool_seconds
+        self.tracers = []
+
+    async def astream_events(self, inputs, config=None, version=None):
+        tracer = config["callbacks"][0]
+        run_id = uuid.uuid4()
+        tracer.on_tool_start({"name": "get_weather_by_place"}, "Milano", run_id=run_id)
+        yield {"event": "on_tool_start", "name": "get_weather_by_place",
+               "data": {"input": {"place": "Milano"}}, "parent_ids": ["run"]}
+        await asyncio.sleep(self.tool_seconds)
+        tracer.on_tool_end("Sunny, 21°C", run_id=run_id)
+        yield {"event": "on_tool_end", "name": "get_weather_by_place",
+               "data": {"output": "Sunny, 21°C"}, "parent_ids": ["run"]}
+        for token in ("A Milano ", "c'è il sole, 21°C."):
+            self.tracers.append(current_tracer.get())
+            yield {"event": "on_chat_model_stream", "data": {"chunk": SimpleNamespace(content=token)},
+                   "parent_ids": ["run"]}
+        yield {"event": "on_chain_end", "data": {"output": {"output": ANSWER}}, "parent_ids": []}
+
+
+class FakeAnswerCache:
+    def __init__(self):
+        self.puts = []
+
+    def get(self, question):
+        return None, [1.0, 0.0]
+
+    def put(self, question, answer, ttl, vector=None):
+        self.puts.append((question, answer, ttl, vector))
+
+
+class FakeLLM:
+    def get_num_tokens(self, text):
+        return len(text.split())
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    executor = FakeExecutor()
+    answer_cache = FakeAnswerCache()
+    monkeypatch.setattr(agent, "streaming_agent_executor", executor)
+    monkeypatch.setattr(agent, "answer_cache", answer_cache)
+    return executor, answer_cache
+
+
+def test_stream_agent_runs_to_completion(fake_agent):
+    executor, answer_cache = fake_agent
+    tracer = AgentTracer()
+
+    events = list(agent.stream_agent(QUESTION, [], tracer))
+
+    assert [event["type"] for event in events] == ["tool_start", "tool_end", "token", "token", "final"]
+    assert events[-1]["content"] == ANSWER
+    # Tracer attivo anche dopo il primo evento e span radice registrato alla fine del run
+    assert executor.tracers == [tracer, tracer]
+    assert [span["kind"] for span in tracer.spans] == ["tool", "agent"]
+    # Risposta salvata con il TTL del meteo
+    assert answer_cache.puts == [(QUESTION, ANSWER, 10 * 60, [1.0, 0.0])]
+
+
+def test_chat_turn_updates_history(fake_agent, monkeypatch, capsys):
+    _, answer_cache = fake_agent
+    monkeypatch.setattr(main, "STREAMING", True)
+    history = ChatHistory(FakeLLM(), summarize=False)
+
+    assert main.chat_turn(QUESTION, history) == ANSWER
+
+    messages = history.messages()
+    assert [message.content for message in messages] == [QUESTION, ANSWER]
+    assert len(answer_cache.puts) == 1
+    assert "c'è il sole" in capsys.readouterr().out
+
+
+def test_answer_cached_when_reader_stops_at_final(fake_agent):
+    _, answer_cache = fake_agent
+
+    # Come ask_agent: chi riceve "final" smette di leggere e chiude il generatore
+    for event in agent.stream_agent(QUESTION):
+        if event["type"] == "final":
+            break
+
+    assert answer_cache.puts == [(QUESTION, ANSWER, 10 * 60, [1.0, 0.0])]
+
+
+def test_stream_agent_closed_early_cancels_the_run(fake_agent):
+    executor, answer_cache = fake_agent
+    executor.tool_seconds = 30  # Il tool è ancora in corso quando il chiamante smette di leggere
+
+    events = agent.stream_agent(QUESTION)
+    assert next(events)["type"] == "tool_start"
+    events.close()
+
+    # Il run interrotto non lascia task pendenti e non salva risposte a metà
+    assert not asyncio.all_tasks(agent._get_loop())
+    assert answer_cache.puts == []
@@ -1,9 +1,20 @@
 # File: tools.py
 # Tools per l'agente di viaggio
 
-import requests
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from langchain.tools import tool
-from typing import Optional
+from typing import Optional, List
+from urllib.parse import urlsplit
+from http_client import get_json, aget_json, UpstreamHTTPError
+from rate_limit import set_rate_limit
+from cache import cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # agent_common/ (root del repo)
+from agent_common.instrumentation import record_event  # noqa: E402
 
 # Headers per Nominatim (richiede User-Agent)
 HEADERS = {
@@ -11,6 +22,58 @@ HEADERS = {
     'Accept-Language': 'en'
 }
 
+# Endpoint dei servizi esterni (sovrascrivibili, es. per puntare a stub server locali)
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com")
+RESTCOUNTRIES_URL = os.getenv("RESTCOUNTRIES_URL", "https://restcountries.com")
+EXCHANGE_RATES_URL = os.getenv("EXCHANGE_RATES_URL", "https://open.er-api.com")
+
+# Policy di Nominatim: max 1 richiesta/secondo (attende solo se serve davvero)
+set_rate_limit(urlsplit(NOMINATIM_URL).netloc, rate=1.0)
+
+# Luogo non trovato ([]): in cache solo per poco, un errore di battitura o un buco
+# temporaneo di Nominatim non deve restare "non trovato" per tutto il TTL del geocoding
+GEOCODE_NOT_FOUND_TTL = 10 * 60
+
+# Valuta base della tabella dei cambi in cache: i cross rate si derivano da qui
+FX_BASE = "USD"
+
+def _cached_get_json(namespace: str, key: str, url: str, params: dict = None, headers: dict = None,
+                     cacheable=lambda data: True, ttl=lambda data: None):
+    """get_json con la cache condivisa davanti (TTL per namespace, vedi cache.TTLS).
+
+    ttl: funzione risposta -> TTL in secondi, o None per quello del namespace
+    """
+    data = cache.get(namespace, key)
+    if data is not None:
+        record_event("cache_hit", namespace)
+    else:
+        data = get_json(url, params=params, headers=headers)
+        if cacheable(data):
+            cache.set(namespace, key, data, ttl(data))
+    return data
+
+async def _acached_get_json(namespace: str, key: str, url: str, params: dict = None, headers: dict = None,
+                            cacheable=lambda data: True, ttl=lambda data: None):
+    data = cache.get(namespace, key)
+    if data is not None:
+        record_event("cache_hit", namespace)
+    else:
+        data = await aget_json(url, params=params, headers=headers)
+        if cacheable(data):
+            cache.set(namespace, key, data, ttl(data))
+    return data
+
+def _coords_key(latitude: float, longitude: float) -> str:
+    # ~1 km di precisione: punti vicini condividono la stessa voce di cache
+    return f"{round(float(latitude), 2)},{round(float(longitude), 2)}"
+
+def _geocode_ttl(data: list):
+    return None if data else GEOCODE_NOT_FOUND_TTL
+
+def _fx_ok(data: dict) -> bool:
+    return data.get('result') == 'success'
+
 print("✅ Tools module loaded")
 
 @tool
@@ -25,24 +88,40 @@ def search_location(query: str) -> str:
     Returns:
         Location details including coordinates, country, and display name.
     """
-    import time
-    time.sleep(1)  # Rispetta rate limit di Nominatim
+    try:
+        data = _geocode(query)
+    except Exception as e:
+        return f"Error searching location: {e}"
     
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
+    return _format_location(query, data)
+
+async def _asearch_location(query: str) -> str:
+    try:
+        data = await _ageocode(query)
+    except Exception as e:
+        return f"Error searching location: {e}"
+    
+    return _format_location(query, data)
+
+search_location.coroutine = _asearch_location
+
+def _geocode(query: str) -> list:
+    return _cached_get_json("geocode", query.strip().lower(), f"{NOMINATIM_URL}/search",
+                            params=_location_params(query), headers=HEADERS, ttl=_geocode_ttl)
+
+async def _ageocode(query: str) -> list:
+    return await _acached_get_json("geocode", query.strip().lower(), f"{NOMINATIM_URL}/search",
+                                   params=_location_params(query), headers=HEADERS, ttl=_geocode_ttl)
+
+def _location_params(query: str) -> dict:
+    return {
         'q': query,
         'format': 'json',
         'limit': 1,
         'addressdetails': 1
     }
-    
-    try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        return f"Error searching location: {e}"
-    
+
+def _format_location(query: str, data: list) -> str:
     if not data:
         return f"Location '{query}' not found."
     
@@ -65,21 +144,34 @@ def get_weather(latitude: float, longitude: float) -> str:
     Returns:
         Current weather including temperature, humidity, wind speed.
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'current': 'temperature_2m,relative_humidity_2m,wind_speed_10m,weather_code',
-        'timezone': 'auto'
-    }
+    try:
+        data = _cached_get_json("weather", _coords_key(latitude, longitude), f"{OPEN_METEO_URL}/v1/forecast",
+                                params=_weather_params(latitude, longitude))
+    except Exception as e:
+        return f"Error getting weather: {e}"
     
+    return _format_weather(data)
+
+async def _aget_weather(latitude: float, longitude: float) -> str:
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = await _acached_get_json("weather", _coords_key(latitude, longitude), f"{OPEN_METEO_URL}/v1/forecast",
+                                       params=_weather_params(latitude, longitude))
     except Exception as e:
         return f"Error getting weather: {e}"
     
+    return _format_weather(data)
+
+get_weather.coroutine = _aget_weather
+
+def _weather_params(latitude: float, longitude: float) -> dict:
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'current': 'temperature_2m,relative_humidity_2m,wind_speed_10m,weather_code',
+        'timezone': 'auto'
+    }
+
+def _format_weather(data: dict) -> str:
     current = data.get('current', {})
     return f"""Current Weather:
 Temperature: {current.get('temperature_2m')}°C
@@ -100,22 +192,35 @@ def get_forecast(latitude: float, longitude: float, days: int = 7) -> str:
     Returns:
         Daily forecast with max/min temperatures and weather conditions.
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+    try:
+        data = _cached_get_json("forecast", f"{_coords_key(latitude, longitude)},{days}", f"{OPEN_METEO_URL}/v1/forecast",
+                                params=_forecast_params(latitude, longitude, days))
+    except Exception as e:
+        return f"Error getting forecast: {e}"
+    
+    return _format_forecast(data, days)
+
+async def _aget_forecast(latitude: float, longitude: float, days: int = 7) -> str:
+    try:
+        data = await _acached_get_json("forecast", f"{_coords_key(latitude, longitude)},{days}", f"{OPEN_METEO_URL}/v1/forecast",
+                                       params=_forecast_params(latitude, longitude, days))
+    except Exception as e:
+        return f"Error getting forecast: {e}"
+    
+    return _format_forecast(data, days)
+
+get_forecast.coroutine = _aget_forecast
+
+def _forecast_params(latitude: float, longitude: float, days: int) -> dict:
+    return {
         'latitude': latitude,
         'longitude': longitude,
         'daily': 'temperature_2m_max,temperature_2m_min,precipitation_probability_max',
         'timezone': 'auto',
         'forecast_days': min(days, 16)
     }
-    
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        return f"Error getting forecast: {e}"
-    
+
+def _format_forecast(data: dict, days: int) -> str:
     daily = data.get('daily', {})
     dates = daily.get('time', [])
     max_temps = daily.get('temperature_2m_max', [])
@@ -141,16 +246,28 @@ def get_country_info(country_name: str) -> str:
     Returns:
         Country details: capital, currency, languages, population, timezone.
     """
-    url = f"https://restcountries.com/v3.1/name/{country_name}"
+    try:
+        data = _cached_get_json("country", country_name.strip().lower(), f"{RESTCOUNTRIES_URL}/v3.1/name/{country_name}")[0]
+    except UpstreamHTTPError:
+        return f"Country '{country_name}' not found."
+    except Exception as e:
+        return f"Error getting country info: {e}"
     
+    return _format_country(data)
+
+async def _aget_country_info(country_name: str) -> str:
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            return f"Country '{country_name}' not found."
-        data = response.json()[0]
+        data = (await _acached_get_json("country", country_name.strip().lower(), f"{RESTCOUNTRIES_URL}/v3.1/name/{country_name}"))[0]
+    except UpstreamHTTPError:
+        return f"Country '{country_name}' not found."
     except Exception as e:
         return f"Error getting country info: {e}"
     
+    return _format_country(data)
+
+get_country_info.coroutine = _aget_country_info
+
+def _format_country(data: dict) -> str:
     # Estrai info principali
     currencies = list(data.get('currencies', {}).keys())
     languages = list(data.get('languages', {}).values())
@@ -177,33 +294,155 @@ def convert_currency(from_currency: str, to_currency: str, amount: float) -> str
     Returns:
         Converted amount with exchange rate.
     """
-    url = f"https://open.er-api.com/v6/latest/{from_currency.upper()}"
+    try:
+        data = _cached_get_json("fx", FX_BASE, f"{EXCHANGE_RATES_URL}/v6/latest/{FX_BASE}", cacheable=_fx_ok)
+    except Exception as e:
+        return f"Error converting currency: {e}"
     
+    return _format_conversion(data, from_currency, to_currency, amount)
+
+async def _aconvert_currency(from_currency: str, to_currency: str, amount: float) -> str:
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = await _acached_get_json("fx", FX_BASE, f"{EXCHANGE_RATES_URL}/v6/latest/{FX_BASE}", cacheable=_fx_ok)
     except Exception as e:
         return f"Error converting currency: {e}"
     
-    if data.get('result') != 'success':
+    return _format_conversion(data, from_currency, to_currency, amount)
+
+convert_currency.coroutine = _aconvert_currency
+
+def _format_conversion(data: dict, from_currency: str, to_currency: str, amount: float) -> str:
+    if not _fx_ok(data):
         return f"Currency conversion failed. Check currency codes."
     
     rates = data.get('rates', {})
+    from_upper = from_currency.upper()
     to_upper = to_currency.upper()
     
+    if from_upper not in rates:
+        return f"Currency '{from_currency}' not found."
     if to_upper not in rates:
         return f"Currency '{to_currency}' not found."
     
-    rate = rates[to_upper]
+    # Cross rate dalla tabella con base FX_BASE: from -> FX_BASE -> to
+    rate = rates[to_upper] / rates[from_upper]
     converted = amount * rate
     
-    return f"""{amount} {from_currency.upper()} = {converted:.2f} {to_upper}
-Exchange rate: 1 {from_currency.upper()} = {rate:.4f} {to_upper}
+    return f"""{amount} {from_upper} = {converted:.2f} {to_upper}
+Exchange rate: 1 {from_upper} = {rate:.4f} {to_upper}
 Last updated: {data.get('time_last_update_utc', 'N/A')}"""
 
+# Tools composti: geocoding + meteo in una sola chiamata, senza un giro LLM in più
+
+MAX_PLACES = 10
+
+def _place_weather(place: str) -> str:
+    try:
+        locations = _geocode(place)
+        if not locations:
+            return f"Location '{place}' not found."
+        loc = locations[0]
+        data = _cached_get_json("weather", _coords_key(loc['lat'], loc['lon']), f"{OPEN_METEO_URL}/v1/forecast",
+                                params=_weather_params(loc['lat'], loc['lon']))
+    except Exception as e:
+        return f"Error getting weather for '{place}': {e}"
+    return f"Location: {loc.get('display_name')}\n{_format_weather(data)}"
+
+async def _aplace_weather(place: str) -> str:
+    try:
+        locations = await _ageocode(place)
+        if not locations:
+            return f"Location '{place}' not found."
+        loc = locations[0]
+        data = await _acached_get_json("weather", _coords_key(loc['lat'], loc['lon']), f"{OPEN_METEO_URL}/v1/forecast",
+                                       params=_weather_params(loc['lat'], loc['lon']))
+    except Exception as e:
+        return f"Error getting weather for '{place}': {e}"
+    return f"Location: {loc.get('display_name')}\n{_format_weather(data)}"
+
+@tool
+def get_weather_by_place(place: str) -> str:
+    """
+    Get current weather for a place by name. Geocodes the place internally,
+    so there is no need to call search_location first.
+    
+    Args:
+        place: Name of the place (e.g., 'Rome', 'Eiffel Tower')
+    
+    Returns:
+        Resolved location name and current weather.
+    """
+    return _place_weather(place)
+
+get_weather_by_place.coroutine = _aplace_weather
+
+@tool
+def get_weather_for_places(places: List[str]) -> str:
+    """
+    Get current weather for several places at once (e.g., comparing cities).
+    All places are looked up in parallel in a single call.
+    
+    Args:
+        places: List of place names (e.g., ['Rome', 'Paris', 'Tokyo']), max 10
+    
+    Returns:
+        Current weather for each place.
+    """
+    places = places[:MAX_PLACES]
+    # Ogni thread gira in una copia del contesto corrente (tracing della richiesta)
+    contexts = [copy_context() for _ in places]
+    with ThreadPoolExecutor(max_workers=max(1, len(places))) as pool:
+        return "\n\n".join(pool.map(lambda ctx, place: ctx.run(_place_weather, place), contexts, places))
+
+async def _aget_weather_for_places(places: List[str]) -> str:
+    results = await asyncio.gather(*[_aplace_weather(place) for place in places[:MAX_PLACES]])
+    return "\n\n".join(results)
+
+get_weather_for_places.coroutine = _aget_weather_for_places
+
+@tool
+def get_forecast_by_place(place: str, days: int = 7) -> str:
+    """
+    Get the weather forecast for a place by name. Geocodes the place internally,
+    so there is no need to call search_location first.
+    
+    Args:
+        place: Name of the place (e.g., 'Rome', 'Eiffel Tower')
+        days: Number of days to forecast (1-16, default 7)
+    
+    Returns:
+        Resolved location name and daily forecast.
+    """
+    try:
+        locations = _geocode(place)
+        if not locations:
+            return f"Location '{place}' not found."
+        loc = locations[0]
+        data = _cached_get_json("forecast", f"{_coords_key(loc['lat'], loc['lon'])},{days}", f"{OPEN_METEO_URL}/v1/forecast",
+                                params=_forecast_params(loc['lat'], loc['lon'], days))
+    except Exception as e:
+        return f"Error getting forecast for '{place}': {e}"
+    return f"Location: {loc.get('display_name')}\n{_format_forecast(data, days)}"
+
+async def _aget_forecast_by_place(place: str, days: int = 7) -> str:
+    try:
+        locations = await _ageocode(place)
+        if not locations:
+            return f"Location '{place}' not found."
+        loc = locations[0]
+        data = await _acached_get_json("forecast", f"{_coords_key(loc['lat'], loc['lon'])},{days}", f"{OPEN_METEO_URL}/v1/forecast",
+                                       params=_forecast_params(loc['lat'], loc['lon'], days))
+    except Exception as e:
+        return f"Error getting forecast for '{place}': {e}"
+    return f"Location: {loc.get('display_name')}\n{_format_forecast(data, days)}"
+
+get_forecast_by_place.coroutine = _aget_forecast_by_place
+
 # Lista di tutti i tools disponibili
 ALL_TOOLS = [
+    get_weather_by_place,
+    get_weather_for_places,
+    get_forecast_by_place,
     search_location,
     get_weather,
     get_forecast,